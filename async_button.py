@@ -12,6 +12,8 @@ import micropython
 import uasyncio
 from machine import Pin
 
+from async_runner import inhibit_idle
+
 
 class Button:
     RELEASE = 2
@@ -39,9 +41,11 @@ class Button:
         self.events = 0
         self.ignore_button_irq = False
         self.task = uasyncio.create_task(self())
+        inhibit_idle()  # lightsleep would delay the button irq
 
     def cancel(self):
         self.task.cancel()
+        inhibit_idle(False)
 
     def clear(self):
         self.events = 0
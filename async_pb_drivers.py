@@ -3,13 +3,103 @@
 # https://opensource.org/licenses/MIT
 
 
+import array
+import gc
+import time
+
+import micropython
 import rp2
-from machine import Pin, bitstream
+import uasyncio
+from machine import Pin, SPI, Timer, bitstream
 
 import hardware
 from async_runner import as_pins, as_pwm
-from pio_state_machines import __WS282B__, __SK6812__
-from pixel_buffers import PixelBufferPWM, PixelBufferNeo, PixelBufferBit
+from frame_clock import FrameClock
+from pio_state_machines import __WS282B__, __SK6812__, ws2812_parallel
+from pixel_buffers import APA102Frame, BitPlanes, PixelBufferPWM, PixelBufferNeo, PixelBufferBit
+
+
+class FrameStats:
+    """
+    Frame timing of a driver (us). Pass an instance as frame_stats to a driver that supports it.
+    render: time the pattern took to draw a frame, driver: time the driver itself spent per frame
+    alloc: bytes allocated by the pattern per frame
+    skew: difference in frame start between the strips of a multi strip driver
+    """
+
+    def __init__(self):
+        self.frames = 0
+        self.alloc_bytes_ewma = 0
+        self.alloc_bytes_max = 0
+        self.render_us_ewma = 0
+        self.render_us_max = 0
+        self.driver_us_ewma = 0
+        self.driver_us_max = 0
+        self.skew_us_ewma = 0
+        self.skew_us_max = 0
+
+    @micropython.native
+    def render(self, us: int):
+        self.render_us_ewma += (us - self.render_us_ewma) >> 3
+        if us > self.render_us_max:
+            self.render_us_max = us
+
+    @micropython.native
+    def driver(self, us: int):
+        self.frames += 1
+        self.driver_us_ewma += (us - self.driver_us_ewma) >> 3
+        if us > self.driver_us_max:
+            self.driver_us_max = us
+
+    @micropython.native
+    def alloc(self, n_bytes: int):
+        self.alloc_bytes_ewma += (n_bytes - self.alloc_bytes_ewma) >> 3
+        if n_bytes > self.alloc_bytes_max:
+            self.alloc_bytes_max = n_bytes
+
+    @micropython.native
+    def skew(self, us: int):
+        self.skew_us_ewma += (us - self.skew_us_ewma) >> 3
+        if us > self.skew_us_max:
+            self.skew_us_max = us
+
+    def __str__(self):
+        return 'frames:%7d  render us ewma/max:%6d/%6d  driver us ewma/max:%6d/%6d  alloc ewma/max:%5d/%5d' \
+               '  skew us ewma/max:%5d/%5d' % (
+                   self.frames, self.render_us_ewma, self.render_us_max, self.driver_us_ewma, self.driver_us_max,
+                   self.alloc_bytes_ewma, self.alloc_bytes_max, self.skew_us_ewma, self.skew_us_max)
+
+
+class LedTransfer:
+    """
+    Completion of a DMA transfer to a led strip, including the latch (reset) gap after the last bit.
+    There is no DMA interrupt hook in hardware.py, so a one shot timer that expires when the strip has latched
+    sets a ThreadSafeFlag. Wait for it with: while transfer.busy: yield transfer.flag
+    """
+
+    def __init__(self, n, bpp, latch_us=300):
+        """
+        :param latch_us: low time the leds need to latch a frame (ws2812b: 280us, sk6812: 80us)
+        """
+        self.flag = uasyncio.ThreadSafeFlag()
+        self.busy = False
+        self.timer = Timer()
+        frame_us = n * bpp * 10 + latch_us + 50  # 1.25us per bit, plus margin for the timer
+        self.freq = max(1, 1_000_000 // frame_us)  # rounds down, so never too early
+        self._callback = self._done  # bound once, starting a transfer should not allocate
+
+    @micropython.native
+    def start(self):
+        self.busy = True
+        self.timer.init(mode=Timer.ONE_SHOT, freq=self.freq, callback=self._callback)
+
+    def _done(self, timer):
+        self.busy = False
+        self.flag.set()
+
+    def deinit(self):
+        self.timer.deinit()
+        self.busy = False
 
 
 def pin_driver(pin_ids, pattern, **kwargs):
@@ -17,29 +107,63 @@ def pin_driver(pin_ids, pattern, **kwargs):
 
     pixel_buffer = PixelBufferBit(len(pins))
 
+    buf = pixel_buffer.buf
     for delay_ms in pattern(pixel_buffer=pixel_buffer, **kwargs):
 
-        # send buffer to pwm pins
-        for pin, pixel in zip(pins, pixel_buffer):
-            pin.value(pixel)
+        # send changed pixels to pins
+        i, end = pixel_buffer.clean()
+        if i >= end:
+            pixel_buffer.frames_skipped += 1
+        while i < end:
+            pins[i].value(buf[i])
+            i += 1
 
         yield delay_ms
 
 
-def pwm_driver(pin_ids, pattern, freq_pwm=10_000, **kwargs):
-    pwm_pins = as_pwm(pin_ids=pin_ids, freq_pwm=freq_pwm)
+def pwm_driver(pin_ids, pattern, freq_pwm=10_000, dma=False, pace=False, **kwargs):
+    """
+    :param dma: write all duty cycles with one DMA chain instead of a duty_u16() call per pin
+    :param pace: (dma only) update the duty cycles at the wrap of the pwm counter
+    """
+    pwm_pins = as_pwm(pin_ids, freq_pwm)
 
     pixel_buffer = PixelBufferPWM(len(pwm_pins))
 
+    if dma:
+        yield from _pwm_driver_dma(pin_ids, pixel_buffer, pattern, pace, kwargs)
+        return
+
+    buf = pixel_buffer.buf
     for delay_ms in pattern(pixel_buffer=pixel_buffer, **kwargs):
 
-        # send buffer to pwm pins
-        for pin, pixel in zip(pwm_pins, pixel_buffer):
-            pin.duty_u16(pixel)
+        # send changed pixels to pwm pins
+        i, end = pixel_buffer.clean()
+        if i >= end:
+            pixel_buffer.frames_skipped += 1
+        while i < end:
+            pwm_pins[i].duty_u16(buf[i])
+            i += 1
 
         yield delay_ms
 
 
+def _pwm_driver_dma(pin_ids, pixel_buffer, pattern, pace, kwargs):
+    scatter = hardware.PWMScatter(pin_ids, pace)
+    try:
+        for delay_ms in pattern(pixel_buffer=pixel_buffer, **kwargs):
+
+            # sent all duty cycles in one transfer
+            if pixel_buffer.dirty and scatter.commit(pixel_buffer.buf):
+                pixel_buffer.clean()
+            else:
+                pixel_buffer.frames_skipped += 1  # unchanged or still busy with the previous frame
+
+            yield delay_ms
+    finally:  # task cancelled or replaced
+        scatter.release()
+
+
 def neo_driver_bitstream(pin, pattern, n, bpp=4, timing=1, **kwargs):
     # Timing arg can either be 1 for 800kHz or 0 for 400kHz,
     # or a user-specified timing ns tuple (high_0, low_0, high_1, low_1).
@@ -55,12 +179,23 @@ def neo_driver_bitstream(pin, pattern, n, bpp=4, timing=1, **kwargs):
 
         # sent pixels to leds
         # BITSTREAM_TYPE_HIGH_LOW = 0
-        bitstream(pin, 0, timing, pixel_buffer.buf)
+        if pixel_buffer.dirty:
+            pixel_buffer.clean()
+            bitstream(pin, 0, timing, pixel_buffer.output())
+        else:
+            pixel_buffer.frames_skipped += 1
 
         yield delay_ms
 
 
-def neo_driver_pio(pin, pattern, n, bpp=3, state_machine=0, **kwargs):
+def neo_driver_pio(pin, pattern, n, bpp=3, state_machine=0, chunk_words=None, frame_stats: FrameStats = None,
+                   **kwargs):
+    """
+    :param chunk_words: (None) words put in the state machine fifo before giving other tasks a turn.
+                        None puts the whole frame with a single sm.put(), which blocks until the fifo has taken
+                        the last word. With chunks the other tasks must be short: when the fifo runs empty for
+                        longer than the latch time the leds take the partial frame.
+    """
     if bpp == 3:
         pio_driver = __WS282B__
     elif bpp == 4:
@@ -75,19 +210,303 @@ def neo_driver_pio(pin, pattern, n, bpp=3, state_machine=0, **kwargs):
 
     pixel_buffer = PixelBufferNeo(n, bpp)
 
-    sm_put = lambda x: sm.put(x)
+    chunks_of = None  # output array the chunks are views of, output() only changes it with set_correction()
+    chunks = None
+
+    try:
+        for delay_ms in pattern(pixel_buffer=pixel_buffer, **kwargs):
+            if frame_stats is not None:
+                start = time.ticks_us()
+
+            # sent pixels to led strip
+            if pixel_buffer.dirty:
+                pixel_buffer.clean()
+                out = pixel_buffer.output()
+                if chunk_words is None:
+                    sm.put(out)
+                else:
+                    if out is not chunks_of:  # views are made once, so sending does not allocate
+                        view = memoryview(out)
+                        chunks = [view[i:i + chunk_words] for i in range(0, len(out), chunk_words)]
+                        chunks_of = out
+                    last = len(chunks) - 1
+                    i = 0
+                    while True:
+                        sm.put(chunks[i])
+                        if i == last:
+                            break
+                        i += 1
+                        if frame_stats is not None:
+                            driver_us = time.ticks_diff(time.ticks_us(), start)
+                        yield 0  # other tasks run while the fifo drains
+                        if frame_stats is not None:  # time spent in other tasks is not driver time
+                            start = time.ticks_add(time.ticks_us(), -driver_us)
+            else:
+                pixel_buffer.frames_skipped += 1
+
+            if frame_stats is not None:
+                frame_stats.driver(time.ticks_diff(time.ticks_us(), start))
+
+            yield delay_ms
+    finally:  # task cancelled or replaced
+        sm.active(0)
+
+
+def neo_driver_dma(pin, pattern, n, bpp=3, state_machine=0, frame_stats: FrameStats = None, ping_pong=False,
+                   latch_us=300, **kwargs):
+    """
+    :param ping_pong: send from two alternating buffers, so the pattern never draws in the buffer that is being
+                      sent and the next frame can be prepared while the previous one is still being sent
+    :param latch_us: low time the leds need after a frame before the next one can start
+    """
+    if bpp == 3:
+        pio_driver = __WS282B__
+    elif bpp == 4:
+        pio_driver = __SK6812__
+    else:
+        raise Exception('bbp can not be %i but most be either 3 or 4' % bpp)
 
-    buf = pixel_buffer.buf
-    for delay_ms in pattern(pixel_buffer=pixel_buffer, **kwargs):
+    pin = Pin(pin, Pin.OUT)
+    sm = rp2.StateMachine(state_machine, pio_driver, freq=8_000_000, sideset_base=pin)
+    sm.active(1)
 
-        # sent pixels to led strip
-        for p in buf:
-            sm_put(p)
+    dma_channel = hardware.dma.allocate_channel()
+    transfer = LedTransfer(n, bpp, latch_us)
 
-        yield delay_ms
+    pixel_buffer = PixelBufferNeo(n, bpp)
+    if ping_pong:
+        front_buffers = [array.array('I', bytearray(n << 2)), array.array('I', bytearray(n << 2))]
+    front = 0
+
+    alloc_mark = gc.mem_alloc()
+    try:
+        for delay_ms in pattern(pixel_buffer=pixel_buffer, **kwargs):
+            if frame_stats is not None:
+                start = time.ticks_us()
+                frame_stats.alloc(gc.mem_alloc() - alloc_mark)
+
+            # sent pixels to neo pixels
+            if pixel_buffer.dirty:
+                pixel_buffer.clean()
+                if ping_pong:
+                    out = pixel_buffer.output(front_buffers[front])  # the other buffer may still be sending
+                    front ^= 1
+                    while transfer.busy:
+                        yield transfer.flag  # previous frame is still being sent or latched
+                else:
+                    out = pixel_buffer.output()
+                dma_channel.mem_2_pio(out, state_machine, hardware.DMA_SIZE_32)
+                transfer.start()
+            else:
+                pixel_buffer.frames_skipped += 1
+
+            if frame_stats is not None:
+                frame_stats.driver(time.ticks_diff(time.ticks_us(), start))
+
+            yield delay_ms
+
+            if not ping_pong:
+                while transfer.busy:
+                    yield transfer.flag  # the pattern draws in the buffer that is being sent
+
+            if frame_stats is not None:
+                alloc_mark = gc.mem_alloc()  # only the pattern runs until the next frame
+    finally:  # task cancelled or replaced
+        transfer.deinit()
+        dma_channel.release()
+        sm.active(0)
+
+
+def neo_driver_multi(strips, state_machine=0, fps=None, frame_stats: FrameStats = None):
+    """
+    Several strips on consecutive state machines. All patterns are rendered in the same frame and the DMA
+    transfers of all strips are started with a single register write, so the frames start together.
+    :param strips: list of (pin, pattern, n, bpp, pattern kwargs dict)
+    :param state_machine: state machine of the first strip
+    :param fps: (None is the delays the patterns yield) render all strips at this frame rate
+    """
+    clock = FrameClock()
+    outputs = []  # (pixel_buffer, dma_channel, state machine id, us per pixel)
+    state_machines = []
+    channel_mask = 0
+    try:
+        for i, (pin, pattern, n, bpp, kwargs) in enumerate(strips):
+            if bpp == 3:
+                pio_driver = __WS282B__
+            elif bpp == 4:
+                pio_driver = __SK6812__
+            else:
+                raise Exception('bbp can not be %i but most be either 3 or 4' % bpp)
+
+            sm_id = state_machine + i
+            sm = rp2.StateMachine(sm_id, pio_driver, freq=8_000_000, sideset_base=Pin(pin, Pin.OUT))
+            sm.active(1)
+            state_machines.append(sm)
+
+            dma_channel = hardware.dma.allocate_channel()
+            channel_mask |= dma_channel.mask
+
+            pixel_buffer = PixelBufferNeo(n, bpp)
+            outputs.append((pixel_buffer, dma_channel, sm_id, bpp * 10))  # 8 bits per byte, 1.25us per bit
+            clock.subscribe(pattern(pixel_buffer=pixel_buffer, **kwargs), fps)
+
+        frames = clock.run()
+        while True:
+            delay_ms = next(frames)  # renders every strip that is due
+
+            start = time.ticks_us()
+            dirty = False
+            for pixel_buffer, _, _, _ in outputs:
+                if pixel_buffer.dirty:
+                    dirty = True
+
+            if dirty:  # strips are always sent together, so they stay in sync
+                for pixel_buffer, dma_channel, sm_id, _ in outputs:
+                    pixel_buffer.clean()
+                    dma_channel.mem_2_pio(pixel_buffer.output(), sm_id, hardware.DMA_SIZE_32, trigger=False)
+                hardware.dma.trigger(channel_mask)
+
+                if frame_stats is not None:  # pixels already sent tell how far apart the strips started
+                    first = 0x3fffffff
+                    last = 0
+                    for pixel_buffer, dma_channel, _, pixel_us in outputs:
+                        us = (pixel_buffer.n - dma_channel.transfer_count()) * pixel_us
+                        if us < first:
+                            first = us
+                        if us > last:
+                            last = us
+                    frame_stats.skew(last - first)
+            else:
+                for pixel_buffer, _, _, _ in outputs:
+                    pixel_buffer.frames_skipped += 1
+
+            if frame_stats is not None:
+                frame_stats.driver(time.ticks_diff(time.ticks_us(), start))
+
+            yield delay_ms
+
+            while hardware.dma.busy(channel_mask):
+                yield 1  # safety in case DMA didn't manage to complete
+    finally:  # task cancelled or replaced
+        for _, dma_channel, _, _ in outputs:
+            dma_channel.release()
+        for sm in state_machines:
+            sm.active(0)
+
+
+def neo_driver_parallel(pin_base, patterns, n, bpp=3, state_machine=0, fps=None, latch_us=300,
+                        frame_stats: FrameStats = None):
+    """
+    Up to 8 strips on consecutive pins, sent in parallel from a single state machine and DMA channel.
+    :param pin_base: pin of the first strip, strip i is on pin_base + i
+    :param patterns: list of (pattern, pattern kwargs dict), one per strip
+    :param n: number of leds, the same for all strips or a list with the length of each strip
+    :param bpp: 3 or 4, the same for all strips
+    """
+    if bpp not in (3, 4):
+        raise Exception('bbp can not be %i but most be either 3 or 4' % bpp)
+    lengths = n if isinstance(n, (list, tuple)) else [n for _ in patterns]
 
+    pixel_buffers = [PixelBufferNeo(length, bpp) for length in lengths]
+    planes = BitPlanes(pixel_buffers)
+
+    sm = rp2.StateMachine(state_machine, ws2812_parallel(len(patterns)), freq=8_000_000, out_base=Pin(pin_base))
+    sm.active(1)
+    dma_channel = hardware.dma.allocate_channel()
+    transfer = LedTransfer(planes.n, bpp, latch_us)
+
+    clock = FrameClock()
+    for pixel_buffer, (pattern, kwargs) in zip(pixel_buffers, patterns):
+        clock.subscribe(pattern(pixel_buffer=pixel_buffer, **kwargs), fps)
+
+    try:
+        for delay_ms in clock.run():  # renders every strip that is due
+
+            start = time.ticks_us()
+            dirty = False
+            for pixel_buffer in pixel_buffers:
+                if pixel_buffer.dirty:
+                    pixel_buffer.clean()
+                    dirty = True
+
+            if dirty:
+                while transfer.busy:
+                    yield transfer.flag  # bit planes are still being sent
+                dma_channel.mem_2_pio(planes.transpose(), state_machine, hardware.DMA_SIZE_32)
+                transfer.start()
+            else:
+                pixel_buffers[0].frames_skipped += 1
+
+            if frame_stats is not None:
+                frame_stats.driver(time.ticks_diff(time.ticks_us(), start))
+
+            yield delay_ms
+    finally:  # task cancelled or replaced
+        transfer.deinit()
+        dma_channel.release()
+        sm.active(0)
+
+
+def apa102_driver(spi_id, sck, mosi, pattern, n, bpp=3, baudrate=8_000_000, brightness=31, dma=False,
+                  frame_stats: FrameStats = None, **kwargs):
+    """
+    APA102 / SK9822 (clock + data) leds on a hardware SPI
+    :param bpp: 3: r, g, b. 4: r, g, b and a per led brightness (0-255) in the 4th channel
+    :param brightness: 0-31 brightness field of every led for bpp 3
+    :param dma: send with DMA at the pace of the spi, instead of spi.write() which waits for the last byte
+    """
+    if bpp not in (3, 4):
+        raise Exception('bbp can not be %i but most be either 3 or 4' % bpp)
+
+    spi = SPI(spi_id, baudrate=baudrate, sck=Pin(sck), mosi=Pin(mosi))
+    pixel_buffer = PixelBufferNeo(n, bpp)
+    frame = APA102Frame(n, bpp, brightness)
+    dma_channel = hardware.dma.allocate_channel() if dma else None
+
+    try:
+        for delay_ms in pattern(pixel_buffer=pixel_buffer, **kwargs):
+            if frame_stats is not None:
+                start = time.ticks_us()
+
+            # sent pixels to leds
+            if pixel_buffer.dirty:
+                pixel_buffer.clean()
+                if dma_channel is None:
+                    spi.write(frame.encode(pixel_buffer.output()))
+                else:
+                    while dma_channel.is_busy():
+                        yield 0  # previous frame is still in the spi fifo, only with very short delays
+                    dma_channel.mem_2_spi(frame.encode(pixel_buffer.output()), spi_id)
+            else:
+                pixel_buffer.frames_skipped += 1
+
+            if frame_stats is not None:
+                frame_stats.driver(time.ticks_diff(time.ticks_us(), start))
+
+            yield delay_ms
+    finally:  # task cancelled or replaced
+        if dma_channel is not None:
+            dma_channel.release()
+        spi.deinit()
+
+
+def _render_step(iterator, frame_stats):  # executed on CPU2
+    if frame_stats is None:
+        return next(iterator)
+    start = time.ticks_us()
+    item = next(iterator)
+    frame_stats.render(time.ticks_diff(time.ticks_us(), start))
+    return item
+
+
+def neo_driver_cpu2(pin, pattern, n, bpp=3, state_machine=0, frame_stats: FrameStats = None, **kwargs):
+    """
+    Same as neo_driver_dma, but the pattern renders frame N+1 on the second core while frame N is sent
+    by DMA. The pattern draws in its own buffer which is copied to the DMA buffer at each frame boundary,
+    so patterns keep working on their previous frame (eg for fading) and don't need to change.
+    """
+    from cpu2_runner import CPU2  # starts the thread on the second core
 
-def neo_driver_dma(pin, pattern, n, bpp=3, state_machine=0, **kwargs):
     if bpp == 3:
         pio_driver = __WS282B__
     elif bpp == 4:
@@ -101,13 +520,38 @@ def neo_driver_dma(pin, pattern, n, bpp=3, state_machine=0, **kwargs):
 
     dma_channel = hardware.dma.allocate_channel()
 
-    pixel_buffer = PixelBufferNeo(n, bpp)
-
-    for delay_ms in pattern(pixel_buffer=pixel_buffer, **kwargs):
-        # sent pixels to neo pixels
-        dma_channel.mem_2_pio(pixel_buffer.buf, state_machine, hardware.DMA_SIZE_32)
-
-        yield delay_ms
-
-        while dma_channel.is_busy():
-            yield 1  # safety in case DMA didn't manage to complete
+    render_buffer = PixelBufferNeo(n, bpp)  # pattern draws here on CPU2
+    front_buffer = PixelBufferNeo(n, bpp)  # sent to the leds by DMA
+    front = front_buffer.buf
+
+    iterator = iter(pattern(pixel_buffer=render_buffer, **kwargs))
+    future = CPU2.submit(_render_step, iterator, frame_stats)
+    try:
+        while True:
+            if not future.done:
+                yield future.flag  # rendering took longer than the frame
+
+            if future.exception is not None:
+                if isinstance(future.exception, StopIteration):
+                    return
+                raise future.exception
+            delay_ms = future.result
+
+            while dma_channel.is_busy():
+                yield 1  # front buffer is still being sent
+
+            start = time.ticks_us()
+            if render_buffer.dirty:
+                render_buffer.clean()
+                render_buffer.output(front)  # swap at the frame boundary
+                dma_channel.mem_2_pio(front, state_machine, hardware.DMA_SIZE_32)
+            else:
+                render_buffer.frames_skipped += 1
+            future = CPU2.submit(_render_step, iterator, frame_stats)
+            if frame_stats is not None:
+                frame_stats.driver(time.ticks_diff(time.ticks_us(), start))
+
+            yield delay_ms
+    finally:  # task cancelled or replaced
+        dma_channel.release()
+        sm.active(0)
@@ -3,12 +3,17 @@
 # https://opensource.org/licenses/MIT
 
 
+import array
 import gc
+import sys
 import time
 
+import micropython
+import machine
 import rp2
 import uasyncio
 from machine import Pin, PWM
+from uasyncio import core
 
 
 def as_pins(pin_ids, *nargs, **kwargs):
@@ -28,33 +33,825 @@ def as_pwm(pin_ids, freq):
     return pwm_pins
 
 
-async def _run(fcn, *nargs, exception_handler, **kwargs) -> None:
+class GCPolicy:
+    """
+    Decides when to run gc.collect() between generator steps (automatic gc is disabled by start_tasks).
+    The base policy collects after every step. Subclass and override should_collect for other policies.
+    """
+
+    def __init__(self):
+        self.collections = 0
+        self.total_us = 0  # time spent in gc.collect()
+        self.max_us = 0
+        self.last_us = 0
+        self.alloc_after_collect = gc.mem_alloc()
+
+    def should_collect(self, idle_ms):
+        """
+        :param idle_ms: time (ms) until the next known deadline or None when unknown
+        """
+        return True
+
+    @micropython.native
+    def after_step(self, idle_ms=None):
+        if self.should_collect(idle_ms):
+            self.collect()
+            return True
+        return False
+
+    @micropython.native
+    def collect(self):
+        start = time.ticks_us()
+        gc.collect()
+        duration = time.ticks_diff(time.ticks_us(), start)
+        self.alloc_after_collect = gc.mem_alloc()
+        self.collections += 1
+        self.total_us += duration
+        self.last_us = duration
+        if duration > self.max_us:
+            self.max_us = duration
+
+    def report(self):
+        print('GC collections:%6d     total:%8dus     max:%6dus     last:%6dus' % (
+            self.collections, self.total_us, self.max_us, self.last_us))
+
+
+class GCAllocThreshold(GCPolicy):
+    """
+    Collect once more than threshold_bytes have been allocated since the last collection
+    """
+
+    def __init__(self, threshold_bytes=16_384):
+        super().__init__()
+        self.threshold_bytes = threshold_bytes
+
+    @micropython.native
+    def should_collect(self, idle_ms):
+        return gc.mem_alloc() - self.alloc_after_collect >= self.threshold_bytes
+
+
+class GCTimeBudget(GCPolicy):
+    """
+    Collect at most once every interval_ms
+    """
+
+    def __init__(self, interval_ms=100):
+        super().__init__()
+        self.interval_ms = interval_ms
+        self.last_collect = time.ticks_ms()
+
+    @micropython.native
+    def should_collect(self, idle_ms):
+        now = time.ticks_ms()
+        if time.ticks_diff(now, self.last_collect) >= self.interval_ms:
+            self.last_collect = now
+            return True
+        return False
+
+
+class GCIdle(GCPolicy):
+    """
+    Collect in idle gaps before the next deadline that are long enough to fit the previous collection.
+    Collection is forced when more than max_alloc_bytes has been allocated, regardless of the gap.
+    """
+
+    def __init__(self, min_idle_ms=2, max_alloc_bytes=32_768):
+        super().__init__()
+        self.min_idle_ms = min_idle_ms
+        self.max_alloc_bytes = max_alloc_bytes
+
+    @micropython.native
+    def should_collect(self, idle_ms):
+        allocated = gc.mem_alloc() - self.alloc_after_collect
+        if allocated >= self.max_alloc_bytes:
+            return True
+        if idle_ms is None or allocated == 0:
+            return False
+        return idle_ms >= self.min_idle_ms and idle_ms * 1000 >= self.last_us
+
+
+gc_policy = GCIdle()
+
+
+def set_gc_policy(policy: GCPolicy):
+    global gc_policy
+    gc_policy = policy
+    return policy
+
+
+class TaskStats:
+    """
+    Timing statistics of a single generator task. Step times are in us, lateness in ms.
+    Lateness histogram buckets: 0, 1, 2-3, 4-7, 8-15, 16-31, 32-63, 64+ ms
+    """
+    HISTOGRAM_BUCKETS = 8
+
+    def __init__(self):
+        self.steps = 0
+        self.step_min_us = 0x3fffffff
+        self.step_max_us = 0
+        self.step_ewma_us = 0
+        self.lateness_max_ms = 0
+        self.lateness_ewma_ms = 0
+        self.missed = 0  # steps that finished after their next deadline
+        self.histogram = array.array('I', [0] * TaskStats.HISTOGRAM_BUCKETS)
+
+    @micropython.native
+    def record(self, lateness_ms: int, step_us: int):
+        self.steps += 1
+        if step_us < self.step_min_us:
+            self.step_min_us = step_us
+        if step_us > self.step_max_us:
+            self.step_max_us = step_us
+        self.step_ewma_us += (step_us - self.step_ewma_us) >> 3  # alpha = 1/8
+
+        if lateness_ms < 0:
+            lateness_ms = 0
+        if lateness_ms > self.lateness_max_ms:
+            self.lateness_max_ms = lateness_ms
+        self.lateness_ewma_ms += (lateness_ms - self.lateness_ewma_ms) >> 3
+
+        bucket = 0
+        while lateness_ms and bucket < TaskStats.HISTOGRAM_BUCKETS - 1:
+            lateness_ms >>= 1
+            bucket += 1
+        self.histogram[bucket] += 1
+
+    def __str__(self):
+        return 'steps:%7d  step us min/ewma/max:%6d/%6d/%6d  late ms ewma/max:%4d/%4d  missed:%5d  hist:%s' % (
+            self.steps, self.step_min_us if self.steps else 0, self.step_ewma_us, self.step_max_us,
+            self.lateness_ewma_ms, self.lateness_max_ms, self.missed, list(self.histogram))
+
+
+idle_inhibitors = 0  # nr of IRQ driven users that can't handle lightsleep or clock changes
+
+
+def inhibit_idle(inhibit=True):
+    """
+    Used by IRQ driven tasks (eg Button, SignalTimer) to block idle hooks that would delay their interrupts
+    """
+    global idle_inhibitors
+    idle_inhibitors += 1 if inhibit else -1
+
+
+class IdleHook:
+    """
+    Called by the scheduler with the time until the next known deadline. The base hook waits with
+    machine.idle(), which wakes on every interrupt and is safe for IRQ driven tasks.
+    Idle time is capped at max_idle_ms as coroutines outside the scheduler (eg MQTT) can't run meanwhile.
+    """
+    inhibitable = False  # skipped while inhibit_idle() is active
+
+    def __init__(self, min_idle_ms=2, margin_ms=1, max_idle_ms=100):
+        """
+        :param min_idle_ms: shorter gaps are left to uasyncio
+        :param margin_ms: wake up this much before the deadline
+        :param max_idle_ms: maximum time to idle in one go
+        """
+        self.min_idle_ms = min_idle_ms
+        self.margin_ms = margin_ms
+        self.max_idle_ms = max_idle_ms
+        self.idle_ms = 0  # total time spent idle
+        self.calls = 0
+        self.start = time.ticks_ms()
+
+    def __call__(self, gap_ms):
+        """
+        :return: time (ms) spent idle
+        """
+        if gap_ms < self.min_idle_ms or (self.inhibitable and idle_inhibitors > 0):
+            return 0
+        gap_ms -= self.margin_ms
+        if gap_ms > self.max_idle_ms:
+            gap_ms = self.max_idle_ms
+        start = time.ticks_ms()
+        self.sleep(gap_ms)
+        spent = time.ticks_diff(time.ticks_ms(), start)
+        self.idle_ms += spent
+        self.calls += 1
+        return spent
+
+    def sleep(self, ms):
+        end = time.ticks_add(time.ticks_ms(), ms)
+        while time.ticks_diff(end, time.ticks_ms()) > 0:
+            machine.idle()
+
+    def idle_fraction(self):
+        elapsed = time.ticks_diff(time.ticks_ms(), self.start)
+        return self.idle_ms / elapsed if elapsed > 0 else 0
+
+    def report(self):
+        print('Idle:%5.1f%%     calls:%8d' % (100 * self.idle_fraction(), self.calls))
+
+
+class LightSleep(IdleHook):
+    """
+    Uses machine.lightsleep for the gap, stops most clocks so IRQ driven tasks should inhibit it
+    """
+    inhibitable = True
+
+    def sleep(self, ms):
+        machine.lightsleep(ms)
+
+
+class LowerFreq(IdleHook):
+    """
+    Lowers machine.freq while idle. PIO and PWM clocks are derived from the system clock, so only use it
+    when no transfers to led strips are running during the gap.
+    """
+    inhibitable = True
+
+    def __init__(self, idle_freq=48_000_000, min_idle_ms=5, margin_ms=1, max_idle_ms=100):
+        super().__init__(min_idle_ms=min_idle_ms, margin_ms=margin_ms, max_idle_ms=max_idle_ms)
+        self.idle_freq = idle_freq
+
+    def sleep(self, ms):
+        run_freq = machine.freq()
+        machine.freq(self.idle_freq)
+        try:
+            super().sleep(ms)
+        finally:
+            machine.freq(run_freq)
+
+
+# WaitFor parks the current task on the queue of an event like Event.wait() and ThreadSafeFlag.wait() do, without
+# creating their coroutine. That uses uasyncio internals: the task queue method was renamed in micropython 1.20,
+# when the internals are not found waits fall back to the wait() coroutine.
+if hasattr(core.TaskQueue, 'push'):  # micropython 1.20 and later
+    def _park(queue, task):
+        queue.push(task)
+elif hasattr(core.TaskQueue, 'push_head'):  # micropython 1.19 and earlier
+    def _park(queue, task):
+        queue.push_head(task)
+else:
+    _park = None
+if not hasattr(core, 'cur_task'):
+    _park = None
+_park_flag = _park is not None and hasattr(core, '_io_queue') and hasattr(core._io_queue, 'queue_read') and \
+             hasattr(uasyncio.ThreadSafeFlag(), 'state')
+
+
+class WaitFor:
+    """
+    Reusable awaitable for an uasyncio.Event or ThreadSafeFlag with an optional timeout. Yield it (or the
+    event itself) from a generator task instead of event.wait(), so no coroutine is created for each wait.
+    After the task resumes, timed_out tells whether the timeout expired before the event was set.
+    Waiting without timeout does not create a coroutine, waits with a timeout fall back to one.
+    """
+
+    def __init__(self, event=None, timeout_ms=None):
+        self.event = event
+        self.timeout_ms = timeout_ms
+        self.timed_out = False
+        self._queued = False
+        self._flag = False  # event is a ThreadSafeFlag
+
+    def __await__(self):
+        self.timed_out = False
+        if self.timeout_ms is None and _park is not None:
+            self._queued = False
+            if isinstance(self.event, uasyncio.Event):
+                self._flag = False
+                return self
+            if _park_flag and isinstance(self.event, uasyncio.ThreadSafeFlag):
+                self._flag = True
+                return self
+        return self._wait()
+
+    __iter__ = __await__
+
+    def __next__(self):
+        event = self.event
+        if self._flag:
+            # same as ThreadSafeFlag.wait(): the poller schedules the task once the flag is set, waiting clears it
+            if self._queued or event.state:
+                self._queued = False
+                event.state = 0
+                raise StopIteration
+            self._queued = True
+            core._io_queue.queue_read(event)  # also links the task to the queue, so it can be cancelled
+            return
+        if self._queued or event.is_set():
+            self._queued = False
+            raise StopIteration
+        # same as Event.wait(): park the current task on the event's queue, Event.set() schedules it again
+        self._queued = True
+        task = core.cur_task
+        _park(event.waiting, task)
+        task.data = event.waiting  # allows the task to be cancelled while waiting
+
+    async def _wait(self):
+        if self.timeout_ms is None:
+            await self.event.wait()
+            return
+        try:
+            await uasyncio.wait_for_ms(self.event.wait(), self.timeout_ms)
+        except uasyncio.TimeoutError:
+            self.timed_out = True
+
+
+class TaskHandle:
+    """
+    Handle returned by add_task. The deadline follows drift free rules: an int yield is added to the
+    previous deadline, so execution time of the task itself is not accumulated.
+
+    When a task falls behind its catch_up policy decides what happens:
+        TaskHandle.BURST    run all missed steps back to back (default)
+        TaskHandle.SKIP     jump the deadline forward by whole periods, the skipped steps are counted as dropped
+        TaskHandle.STRETCH  rebase the deadline on the current time
+
+    At runtime a task can be paused, resumed, cancelled or replaced by another generator. Cleanup hooks
+    added with add_cleanup are called once when the task ends (cancelled, finished or failed).
+    """
+    BURST = 'burst'
+    SKIP = 'skip'
+    STRETCH = 'stretch'
+
+    def __init__(self, fcn, nargs, kwargs, exception_handler, gc_collect=True, stats=False, priority=0,
+                 catch_up=BURST):
+        if catch_up not in (TaskHandle.BURST, TaskHandle.SKIP, TaskHandle.STRETCH):
+            raise Exception('catch_up can not be %s but must be burst, skip or stretch' % catch_up)
+        self.name = fcn.__name__
+        self.fcn = fcn
+        self.nargs = nargs
+        self.kwargs = kwargs
+        self.exception_handler = exception_handler
+        self.gc_collect = gc_collect
+        self.stats = TaskStats() if stats else None
+        self.priority = priority
+        self.catch_up = catch_up
+        self.dropped = 0  # steps skipped by the SKIP policy
+        self.cost_us = 0  # EWMA of the step time, only measured when the scheduler defers low priority work
+        self.deferred = 0
+        self.iterator = None  # created on first step
+        self.deadline = time.ticks_ms()
+        self.done = False
+        self.paused = False
+        self.running = False  # generator is executing a step
+        self.queued = False  # in the scheduler heap
+        self.waiting = False  # awaiting a yielded awaitable
+        self.task = None  # uasyncio task, when not run by the scheduler
+        self.scheduler = None
+        self._resumed = None  # WaitFor, only created when paused without scheduler
+        self._wait_for = None  # WaitFor reused for yielded events
+        self._awaiting = None  # awaitable the scheduler's waiter is waiting on
+        self._waiter = None  # uasyncio task that waits on awaitables for the scheduler
+        self._wake_waiter = None
+        self._replacement = None
+        self._cleanup = []
+        tasks.append(self)
+
+    def add_cleanup(self, fcn):
+        """
+        :param fcn: fn(task_handle) -> None  called once when the task ends
+        """
+        self._cleanup.append(fcn)
+
+    def cancel(self):
+        if self.done:
+            return False
+        self._finish()
+        if self.task is not None and not self.running:
+            self.task.cancel()
+        if self._waiter is not None:
+            self._waiter.cancel()
+        return True
+
+    def pause(self):
+        """
+        Stop stepping the task, a paused task uses no scheduler time
+        """
+        if self.paused or self.done:
+            return
+        self.paused = True
+        if self.scheduler is None:
+            if self._resumed is None:
+                self._resumed = WaitFor(uasyncio.Event())
+            self._resumed.event.clear()
+
+    def resume(self):
+        """
+        Continue a paused task, its deadline is rebased on the current time
+        """
+        if not self.paused or self.done:
+            return
+        self.paused = False
+        if self.scheduler is None:
+            self._resumed.event.set()
+        elif not self.queued and not self.waiting:
+            self.deadline = time.ticks_ms()
+            self.scheduler._schedule(self)
+
+    def replace(self, fcn, *nargs, **kwargs):
+        """
+        Replace the generator at the next step, the current generator is closed and the handle,
+        deadline and stats are kept. Closing runs the finally blocks of the generator, so a driver releases its
+        state machine and DMA channel: use replace_pattern to only change the pattern of a driver.
+        """
+        self._replacement = (fcn, nargs, kwargs)
+
+    def replace_pattern(self, pattern, **kwargs):
+        """
+        Replace the pattern of a driver task at its next frame, the driver keeps running.
+        The pattern argument of the driver must be a patterns.PatternSlot.
+        """
+        for arg in self.nargs + tuple(self.kwargs.values()):
+            if hasattr(arg, 'replace_pattern'):
+                arg.replace_pattern(pattern, **kwargs)
+                return
+        raise Exception('%s has no PatternSlot argument, use replace() to replace the whole task' % self.name)
+
+    def as_awaitable(self, item):
+        """
+        :return: awaitable for a yielded item, events are wrapped in a reused WaitFor
+        """
+        if isinstance(item, (uasyncio.Event, uasyncio.ThreadSafeFlag)):
+            wait_for = self._wait_for
+            if wait_for is None:
+                wait_for = self._wait_for = WaitFor()
+            wait_for.event = item
+            wait_for.timeout_ms = None
+            return wait_for
+        return item
+
+    @micropython.native
+    def step(self):
+        """
+        Advance the generator one step. Raises StopIteration once the generator is exhausted
+        """
+        if self._replacement is not None:
+            if self.iterator is not None:
+                self.iterator.close()
+                self.iterator = None
+            self.fcn, self.nargs, self.kwargs = self._replacement
+            self.name = self.fcn.__name__
+            self._replacement = None
+        if self.iterator is None:
+            self.iterator = iter(self.fcn(*self.nargs, **self.kwargs))
+        stats = self.stats
+        self.running = True
+        try:
+            if stats is None:
+                return next(self.iterator)
+            start = time.ticks_us()
+            lateness_ms = time.ticks_diff(time.ticks_ms(), self.deadline)
+            item = next(self.iterator)
+            stats.record(lateness_ms, time.ticks_diff(time.ticks_us(), start))
+            return item
+        finally:
+            self.running = False
+            if self.done and self.iterator is not None:  # cancelled itself, _finish could not close it
+                self.iterator.close()
+
+    @micropython.native
+    def advance(self, delay_ms: int) -> int:
+        """
+        Move the deadline delay_ms past the previous deadline
+        :return: time left (ms) until the new deadline, negative when already overdue
+        """
+        deadline = time.ticks_add(self.deadline, delay_ms)
+        now = time.ticks_ms()
+        wait_ms = time.ticks_diff(deadline, now)
+        if wait_ms < 0:
+            if self.stats is not None:
+                self.stats.missed += 1
+            catch_up = self.catch_up
+            if catch_up == TaskHandle.SKIP and delay_ms > 0:
+                frames = (delay_ms - 1 - wait_ms) // delay_ms  # whole periods needed to reach now
+                deadline = time.ticks_add(deadline, frames * delay_ms)
+                wait_ms += frames * delay_ms
+                self.dropped += frames
+            elif catch_up == TaskHandle.STRETCH:
+                deadline = now
+                wait_ms = 0
+        self.deadline = deadline
+        return wait_ms
+
+    def _finish(self):
+        if self in tasks:
+            tasks.remove(self)
+        if self.done:
+            return
+        self.done = True
+        if self.iterator is not None and not self.running:
+            self.iterator.close()  # runs the finally blocks of the generator, releasing its hardware
+        for fcn in self._cleanup:
+            try:
+                fcn(self)
+            except Exception as e:
+                sys.print_exception(e)
+
+    def _failed(self, e):
+        self._finish()
+        if self.exception_handler:
+            self.exception_handler(e)
+        else:  # same as the uasyncio default handler, other tasks keep running
+            print('Task %s raised exception:' % self.name)
+            sys.print_exception(e)
+
+
+tasks = []  # registry of all active task handles
+instrument_tasks = False  # default for add_task(stats=None)
+
+
+def enable_stats(enabled=True):
+    """
+    Record TaskStats for all tasks added from now on
+    """
+    global instrument_tasks
+    instrument_tasks = enabled
+
+
+def dump_stats():
+    for task in tasks:
+        if task.stats is not None:
+            print('%-20s %-7s dropped:%5d  %s' % (task.name, task.catch_up, task.dropped, task.stats))
+
+
+async def _run(task: TaskHandle) -> None:
     try:
-        last_wait_time = time.ticks_ms()
-        for item in fcn(*nargs, **kwargs):
-            gc.collect()  # for gc to keep things smooth
+        while not task.done:
+            if task.paused:
+                await task._resumed
+                task.deadline = time.ticks_ms()
+                continue
+            item = task.step()
+            if task.done:  # cancelled itself
+                break
             if isinstance(item, int):
-                last_wait_time = time.ticks_add(last_wait_time, item)
-                wait_for_ms = time.ticks_diff(last_wait_time, time.ticks_ms())
+                wait_for_ms = task.advance(item)
+                if task.gc_collect and gc_policy.after_step(wait_for_ms):
+                    wait_for_ms = time.ticks_diff(task.deadline, time.ticks_ms())
                 if wait_for_ms < 0:
                     wait_for_ms = 0
                 await uasyncio.sleep_ms(wait_for_ms)
             else:
-                await item
-                last_wait_time = time.ticks_ms()
+                if task.gc_collect:
+                    gc_policy.after_step()
+                task.waiting = True
+                await task.as_awaitable(item)
+                task.waiting = False
+                task.deadline = time.ticks_ms()
+    except StopIteration:
+        task._finish()
     except Exception as e:
-        if exception_handler:
-            exception_handler(e)
+        task._finish()
+        if task.exception_handler:
+            task.exception_handler(e)
         else:
             raise
 
 
-def add_task(fcn, *nargs, exception_handler=None, **kwargs):
-    return uasyncio.create_task(_run(fcn, *nargs, exception_handler=exception_handler, **kwargs))
+class Scheduler:
+    """
+    Keeps all generator tasks in a single deadline ordered heap that is driven by one coroutine.
+    All tasks that are due are advanced in one pass, so the event loop only needs to wake a single
+    coroutine instead of one sleeping coroutine per task. Tasks that are due together run highest
+    priority first.
+    """
+
+    def __init__(self, idle_ms=1000, defer_low_priority=False, max_defer_ms=50):
+        """
+        :param idle_ms: maximum time to sleep when there are no tasks
+        :param defer_low_priority: postpone a due task when a higher priority deadline is closer than its step time
+        :param max_defer_ms: a task that is this late is no longer deferred (avoids starvation)
+        """
+        self.heap = []
+        self.idle_ms = idle_ms
+        self.defer_low_priority = defer_low_priority
+        self.max_defer_ms = max_defer_ms
+        self.prioritised = []  # tasks with priority > 0, checked when deferring
+        self._ready = []
+        self.steps = 0  # generator steps executed
+        self.wakeups = 0  # times the scheduler coroutine was resumed by the event loop
+        self._sleeping = False
+        self._wake_requested = False
+        self._gc_pending = False  # a task that allows gc stepped since the last pass
+        self.idle_hook = None  # IdleHook, set by start_tasks
+        self._task = uasyncio.create_task(self._loop())
+
+    def add_task(self, task: TaskHandle):
+        task.scheduler = self
+        if task.priority > 0:
+            self.prioritised.append(task)
+        self._schedule(task)
+        return task
+
+    def _discard(self, task):
+        if task.priority > 0 and task in self.prioritised:
+            self.prioritised.remove(task)
+
+    def _schedule(self, task):
+        self._push(task)
+        if self._sleeping and self.heap[0] is task:  # new earliest deadline, wake up early
+            self._sleeping = False
+            self._wake_requested = True
+            self._task.cancel()
+
+    @micropython.native
+    def _push(self, task):
+        task.queued = True
+        heap = self.heap
+        heap.append(task)
+        i = len(heap) - 1
+        deadline = task.deadline
+        while i > 0:
+            parent = (i - 1) >> 1
+            if time.ticks_diff(deadline, heap[parent].deadline) >= 0:
+                break
+            heap[i] = heap[parent]
+            i = parent
+        heap[i] = task
+
+    @micropython.native
+    def _pop(self):
+        heap = self.heap
+        top = heap[0]
+        top.queued = False
+        last = heap.pop()
+        n = len(heap)
+        if n:
+            deadline = last.deadline
+            i = 0
+            while True:
+                child = 2 * i + 1
+                if child >= n:
+                    break
+                if child + 1 < n and time.ticks_diff(heap[child + 1].deadline, heap[child].deadline) < 0:
+                    child += 1
+                if time.ticks_diff(heap[child].deadline, deadline) >= 0:
+                    break
+                heap[i] = heap[child]
+                i = child
+            heap[i] = last
+        return top
+
+    def _step(self, task):
+        try:
+            if self.defer_low_priority:
+                start = time.ticks_us()
+                item = task.step()
+                task.cost_us += (time.ticks_diff(time.ticks_us(), start) - task.cost_us) >> 2
+            else:
+                item = task.step()
+        except StopIteration:
+            task._finish()
+            self._discard(task)
+            return
+        except Exception as e:
+            task._failed(e)
+            self._discard(task)
+            return
+        self.steps += 1
+        if task.done:  # cancelled itself
+            self._discard(task)
+            return
+        if task.gc_collect:
+            self._gc_pending = True
+        if isinstance(item, int):
+            task.advance(item)
+            self._push(task)
+        else:
+            task.waiting = True
+            task._awaiting = task.as_awaitable(item)
+            if task._waiter is None:  # one waiter per task, reused for every awaitable it yields
+                task._wake_waiter = WaitFor(uasyncio.Event())
+                task._waiter = uasyncio.create_task(self._waiter(task))
+            task._wake_waiter.event.set()
+
+    async def _waiter(self, task):
+        wake = task._wake_waiter
+        while not task.done:
+            await wake
+            wake.event.clear()
+            try:
+                await task._awaiting
+            except Exception as e:
+                task.waiting = False
+                task._failed(e)
+                self._discard(task)
+                return
+            task._awaiting = None
+            task.waiting = False
+            if not task.done and not task.paused:
+                task.deadline = time.ticks_ms()
+                self._schedule(task)
+
+    @micropython.native
+    def _defer_until(self, task, now):
+        """
+        :return: deadline of a higher priority task that is too close to run task first, otherwise None
+        """
+        if not task.cost_us or time.ticks_diff(now, task.deadline) >= self.max_defer_ms:
+            return None
+        for other in self.prioritised:
+            # paused and waiting tasks have no deadline to protect, a deadline in the past is stale
+            if other.priority <= task.priority or other.done or other.paused or other.waiting:
+                continue
+            until = time.ticks_diff(other.deadline, now)
+            if 0 <= until and until * 1000 < task.cost_us:
+                return other.deadline
+        return None
+
+    async def _loop(self):
+        heap = self.heap
+        ready = self._ready
+        while True:
+            # collect everything that is due, tasks are pushed back after they ran so tasks
+            # yielding 0 can't starve the event loop
+            now = time.ticks_ms()
+            while heap and time.ticks_diff(heap[0].deadline, now) <= 0:
+                task = self._pop()
+                if task.done:
+                    self._discard(task)
+                elif not task.paused:  # paused tasks are parked until resumed
+                    ready.append(task)
+                    i = len(ready) - 1  # insertion keeps deadline order within the same priority
+                    while i and ready[i - 1].priority < task.priority:
+                        ready[i] = ready[i - 1]
+                        i -= 1
+                    ready[i] = task
+
+            defer_until = None
+            for task in ready:
+                if task.done:  # cancelled by a task that ran earlier in this pass
+                    self._discard(task)
+                    continue
+                if task.paused:
+                    continue
+                if self.defer_low_priority:
+                    until = self._defer_until(task, time.ticks_ms())
+                    if until is not None:
+                        task.deferred += 1
+                        self._push(task)
+                        if defer_until is None or time.ticks_diff(until, defer_until) < 0:
+                            defer_until = until
+                        continue
+                self._step(task)
+            ready.clear()
+
+            if self._gc_pending:  # one gc decision per pass, using the gap until the next deadline
+                self._gc_pending = False
+                gc_policy.after_step(time.ticks_diff(heap[0].deadline, time.ticks_ms()) if heap else self.idle_ms)
+
+            wait_ms = time.ticks_diff(heap[0].deadline, time.ticks_ms()) if heap else self.idle_ms
+            if defer_until is not None:  # deferred tasks are due, but wait for the higher priority task
+                wait_ms = time.ticks_diff(defer_until, time.ticks_ms())
+            if wait_ms > 0 and self.idle_hook is not None:
+                wait_ms -= self.idle_hook(wait_ms)
+            if wait_ms < 0:
+                wait_ms = 0
+            self._sleeping = True
+            try:
+                await uasyncio.sleep_ms(wait_ms)
+            except uasyncio.CancelledError:
+                if not self._wake_requested:
+                    raise
+            self._wake_requested = False
+            self._sleeping = False
+            self.wakeups += 1
+
+
+_scheduler = None
+
+
+def use_scheduler(idle_ms=1000, defer_low_priority=False, max_defer_ms=50):
+    """
+    Opt in to run all generator tasks added from now on from a single deadline ordered scheduler
+    instead of one uasyncio coroutine per task.
+    """
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = Scheduler(idle_ms=idle_ms, defer_low_priority=defer_low_priority, max_defer_ms=max_defer_ms)
+    return _scheduler
+
+
+def add_task(fcn, *nargs, exception_handler=None, gc_collect=True, stats=None, priority=0,
+             catch_up=TaskHandle.BURST, **kwargs) -> TaskHandle:
+    """
+    :param gc_collect: (True) steps of this task may trigger a collection by the gc_policy
+    :param stats: (None) record TaskStats for this task, None uses the enable_stats() setting
+    :param priority: (0) tasks that are due together run highest priority first (only with use_scheduler)
+    :param catch_up: (TaskHandle.BURST) what to do when the task falls behind, see TaskHandle
+    """
+    task = TaskHandle(fcn, nargs, kwargs, exception_handler, gc_collect=gc_collect,
+                      stats=instrument_tasks if stats is None else stats, priority=priority,
+                      catch_up=catch_up)
+    if _scheduler is not None:
+        return _scheduler.add_task(task)
+    task.task = uasyncio.create_task(_run(task))
+    return task
 
 
-def start_tasks():
+def start_tasks(idle_hook: IdleHook = None):
+    """
+    :param idle_hook: (None) IdleHook to use in gaps before the next deadline, needs use_scheduler()
+    """
     print('Starting tasks')
+    if idle_hook is not None:
+        if _scheduler is None:
+            raise Exception('idle_hook needs use_scheduler() to know the next deadline')
+        _scheduler.idle_hook = idle_hook
 
     # not available in rp2 port
     # sys.atexit(cleanup)
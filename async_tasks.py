@@ -9,7 +9,7 @@ import gc
 import uasyncio
 from machine import Pin, WDT, ADC
 
-from async_runner import as_pwm
+from async_runner import as_pwm, inhibit_idle
 from gbl import ON_BOARD_LED_PIN
 
 
@@ -132,6 +132,7 @@ class SignalTimer:
         self._cb = callback
         self.event = uasyncio.ThreadSafeFlag()
         self.signal_pin.irq(trigger=Pin.IRQ_FALLING | Pin.IRQ_RISING, handler=self.irq_handler, hard=hard)
+        inhibit_idle()  # timing relies on irqs being serviced immediately
         uasyncio.create_task(self())
 
     @micropython.native
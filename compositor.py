@@ -0,0 +1,334 @@
+# MIT License (MIT)
+# Copyright (c) 2022 Bart-Floris Visscher
+# https://opensource.org/licenses/MIT
+
+# Render patterns into their own layer buffer and blend the layers into one output buffer.
+# Layer buffers are allocated once, blending uses the bulk kernels of the pixel buffers.
+
+
+import random
+import time
+
+import micropython
+
+from pixel_buffers import PixelBuffer, PixelBufferNeo, PixelBufferSegment
+
+COPY = 0  # replace what is below
+ADD = 1  # saturating add
+MAX = 2  # per channel maximum
+ALPHA = 3  # blend with the layer opacity (and mask)
+
+FADE = 0  # cross-fade the whole strip
+WIPE = 1  # soft edge moving from the start to the end of the strip
+DISSOLVE = 2  # pixels switch over in random order
+
+
+def _layer_buffer(pixel_buffer, n):
+    """
+    :return: new buffer of the same type as the (root buffer of) pixel_buffer
+    """
+    root = pixel_buffer
+    while isinstance(root, PixelBufferSegment):
+        root = root.buf
+    if isinstance(root, PixelBufferNeo):
+        return PixelBufferNeo(n, root.bpp)
+    return root.__class__(n)
+
+
+@micropython.viper
+def _threshold_mask(mask, order, level: int, soft: int):
+    """
+    mask[i] = clamp((level - order[i]) * soft, 0, 255)
+    """
+    m = ptr8(mask)
+    o = ptr8(order)
+    n = int(len(mask))
+    i = 0
+    while i < n:
+        v = (level - o[i]) * soft
+        m[i] = 0 if v < 0 else (v if v < 255 else 255)
+        i += 1
+
+
+class Layer:
+    def __init__(self, pattern, kwargs=None, mode=ADD, opacity=255, mask=None):
+        """
+        :param pattern: pattern function, called as pattern(layer_buffer, **kwargs)
+        :param mode: COPY, ADD, MAX or ALPHA
+        :param opacity: 0-255, used by ALPHA
+        :param mask: (None) bytearray with an opacity 0-255 per pixel, used by ALPHA. Can be changed in place.
+        """
+        self.pattern = pattern
+        self.kwargs = kwargs if kwargs is not None else dict()
+        self.mode = mode
+        self.opacity = opacity
+        self.mask = mask
+        self.buf = None
+        self.iterator = None
+        self.deadline = 0
+        self.visible = True
+
+        self.renders = 0
+        self.render_us = 0  # ewma
+        self.render_max_us = 0
+
+    @micropython.native
+    def step(self):
+        start = time.ticks_us()
+        self.deadline += next(self.iterator)
+        us = time.ticks_diff(time.ticks_us(), start)
+        self.renders += 1
+        self.render_us += (us - self.render_us) >> 3
+        if us > self.render_max_us:
+            self.render_max_us = us
+
+    def __str__(self):
+        return '%s: %i renders, render %ius (max %ius)' % (
+            self.pattern.__name__, self.renders, self.render_us, self.render_max_us)
+
+
+class Compositor:
+    def __init__(self, pixel_buffer: PixelBuffer, layers):
+        """
+        :param pixel_buffer: output buffer (or segment)
+        :param layers: list of Layer, bottom layer first
+        """
+        self.pixel_buffer = pixel_buffer
+        self.layers = layers
+
+        n = len(pixel_buffer)
+        for layer in layers:
+            layer.buf = _layer_buffer(pixel_buffer, n)
+            layer.iterator = iter(layer.pattern(layer.buf, **layer.kwargs))
+
+        self.composites = 0
+        self.composite_us = 0  # ewma
+        self.composite_max_us = 0
+
+    @micropython.native
+    def composite(self):
+        start = time.ticks_us()
+        out = self.pixel_buffer
+        first = True
+        for layer in self.layers:
+            if not layer.visible:
+                continue
+            mode = layer.mode
+            if first:
+                if mode == ALPHA:
+                    out.fill_range(0, out.n, 0)
+                    out.blend_from(layer.buf, layer.opacity, layer.mask)
+                else:  # COPY, ADD or MAX onto black are all a copy
+                    out.copy_from(layer.buf)
+                first = False
+            elif mode == ADD:
+                out.add_from(layer.buf)
+            elif mode == MAX:
+                out.max_from(layer.buf)
+            elif mode == ALPHA:
+                out.blend_from(layer.buf, layer.opacity, layer.mask)
+            else:
+                out.copy_from(layer.buf)
+        if first:  # nothing visible
+            out.fill_range(0, out.n, 0)
+
+        us = time.ticks_diff(time.ticks_us(), start)
+        self.composites += 1
+        self.composite_us += (us - self.composite_us) >> 3
+        if us > self.composite_max_us:
+            self.composite_max_us = us
+
+    def run(self):
+        """
+        Pattern generator: steps the layers that are due and composites when any of them changed
+        """
+        layers = self.layers
+        cur_time = 0
+        while True:
+            changed = False
+            delay_ms = 0x3fffffff
+            for layer in layers:
+                if layer.deadline <= cur_time:
+                    layer.step()
+                buf = layer.buf
+                if buf.dirty_start < buf.dirty_end:
+                    buf.clean()
+                    changed = True
+                d = layer.deadline - cur_time
+                if d < delay_ms:
+                    delay_ms = d
+
+            if changed:
+                self.composite()
+
+            yield delay_ms
+            cur_time += delay_ms
+
+    def report(self):
+        print('composite %i times, %ius (max %ius)' % (self.composites, self.composite_us, self.composite_max_us))
+        for layer in self.layers:
+            print('  ' + str(layer))
+
+
+class Transition:
+    """
+    Switches between patterns with a cross-fade, wipe or dissolve. Patterns render into one of two buffers that
+    are allocated once; the active buffer is copied to the pixel buffer when it changed. During a transition
+    both patterns run and are blended every frame.
+    """
+
+    def __init__(self, pixel_buffer: PixelBuffer, duration_ms=1000, style=FADE, freq=60, budget_us=None):
+        """
+        :param duration_ms: length of a transition
+        :param style: FADE, WIPE or DISSOLVE
+        :param freq: frame rate during a transition, also the maximum delay that is yielded
+        :param budget_us: (None is half a frame) when both patterns and the blend take longer, the outgoing
+                          pattern is only stepped every other frame
+        """
+        self.pixel_buffer = pixel_buffer
+        self.duration_ms = duration_ms
+        self.style = style
+        self.frame_ms = 1000 // freq
+        self.budget_us = budget_us if budget_us is not None else 500000 // freq
+
+        n = len(pixel_buffer)
+        self.buffers = [_layer_buffer(pixel_buffer, n), _layer_buffer(pixel_buffer, n)]
+        self.mask = bytearray(n)
+        self.order = bytearray(n)  # threshold per pixel for WIPE and DISSOLVE
+        self.slot = 0
+
+        self.cur_time = 0
+        self.iterator = None
+        self.deadline = 0
+        self.step_us = 0
+        self.old_iterator = None
+        self.old_deadline = 0
+        self.old_step_us = 0
+        self.old_skipped = False
+        self.start_time = 0
+        self.blend_us = 0
+        self.transitions = 0
+        self.frames_throttled = 0  # outgoing pattern steps skipped to stay within the budget
+
+    def switch(self, pattern, kwargs=None):
+        """
+        Start pattern(buffer, **kwargs), the first pattern is shown without transition
+        """
+        if kwargs is None:
+            kwargs = dict()
+        if self.old_iterator is not None:  # switching again during a transition, drop the oldest
+            self._finish()
+        if self.iterator is not None and self.duration_ms > 0:
+            self.old_iterator = self.iterator
+            self.old_deadline = self.deadline
+            self.old_step_us = self.step_us
+            self.old_skipped = False
+            self.slot ^= 1
+            self.start_time = self.cur_time
+            self.transitions += 1
+            self._prepare_order()
+        elif self.iterator is not None:
+            self.iterator.close()
+
+        buf = self.buffers[self.slot]
+        buf.fill_range(0, buf.n, 0)
+        self.iterator = iter(pattern(buf, **kwargs))
+        self.deadline = self.cur_time
+        self.step_us = 0
+
+    def redraw(self):
+        """
+        Copy the active pattern to the pixel buffer on the next frame, even if it did not change
+        """
+        buf = self.buffers[self.slot]
+        buf.mark_dirty(0, buf.n)
+
+    def _prepare_order(self):
+        order = self.order
+        n = len(order)
+        if self.style == WIPE:
+            for i in range(n):
+                order[i] = (i * 255) // n
+        elif self.style == DISSOLVE:
+            for i in range(n):
+                order[i] = random.getrandbits(8)
+
+    def _finish(self):
+        """
+        End of a transition, the outgoing pattern is closed so its state can be collected
+        """
+        self.old_iterator.close()
+        self.old_iterator = None
+        old = self.buffers[self.slot ^ 1]
+        old.clean()
+        self.redraw()
+
+    @micropython.native
+    def _step_new(self):
+        start = time.ticks_us()
+        self.deadline += next(self.iterator)
+        self.step_us = time.ticks_diff(time.ticks_us(), start)
+
+    @micropython.native
+    def _step_old(self):
+        if self.old_skipped or self.old_step_us + self.step_us + self.blend_us <= self.budget_us:
+            start = time.ticks_us()
+            self.old_deadline += next(self.old_iterator)
+            self.old_step_us = time.ticks_diff(time.ticks_us(), start)
+            self.old_skipped = False
+        else:
+            self.old_deadline += self.frame_ms
+            self.old_skipped = True
+            self.frames_throttled += 1
+
+    @micropython.native
+    def _blend(self, progress):
+        """
+        :param progress: 0 - 256
+        """
+        start = time.ticks_us()
+        out = self.pixel_buffer
+        new = self.buffers[self.slot]
+        out.copy_from(self.buffers[self.slot ^ 1])
+        style = self.style
+        if style == FADE:
+            out.blend_from(new, progress - (progress >> 8))
+        else:
+            soft = 255 if style == DISSOLVE else 8
+            _threshold_mask(self.mask, self.order, (progress * (256 + 256 // soft)) >> 8, soft)
+            out.blend_from(new, 255, self.mask)
+        self.blend_us = time.ticks_diff(time.ticks_us(), start)
+
+    def run(self):
+        """
+        Pattern generator for the pixel buffer, use switch() to select the pattern
+        """
+        while True:
+            cur_time = self.cur_time
+            delay_ms = self.frame_ms
+            if self.iterator is not None:
+                if self.deadline <= cur_time:
+                    self._step_new()
+                if self.old_iterator is not None:
+                    if self.old_deadline <= cur_time:
+                        self._step_old()
+                    elapsed = cur_time - self.start_time
+                    if elapsed >= self.duration_ms:
+                        self._finish()
+                    else:
+                        self._blend((elapsed << 8) // self.duration_ms)
+                if self.old_iterator is None:
+                    buf = self.buffers[self.slot]
+                    if buf.dirty_start < buf.dirty_end:
+                        buf.clean()
+                        self.pixel_buffer.copy_from(buf)
+                    d = self.deadline - cur_time
+                    if d < delay_ms:
+                        delay_ms = d
+
+            yield delay_ms
+            self.cur_time = cur_time + delay_ms
+
+    def report(self):
+        print('%i transitions, blend %ius, %i outgoing steps throttled' % (
+            self.transitions, self.blend_us, self.frames_throttled))
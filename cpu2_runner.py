@@ -6,10 +6,99 @@
 import _thread
 import time
 
+import micropython
+import uasyncio
+
+
+class RingQueue:
+    """
+    Bounded FIFO queue. With a single producer and a single consumer no lock is needed: the producer
+    only moves tail and the consumer only moves head. Multiple producers have to pass a lock.
+    """
+
+    def __init__(self, size):
+        self.size = size + 1  # one slot is kept free to tell full from empty
+        self.items = [None] * self.size
+        self.head = 0  # next item to get, only changed by the consumer
+        self.tail = 0  # next free slot, only changed by the producer
+
+    @micropython.native
+    def put(self, item) -> bool:
+        """
+        :return: False when the queue is full
+        """
+        tail = self.tail
+        nxt = tail + 1
+        if nxt == self.size:
+            nxt = 0
+        if nxt == self.head:
+            return False
+        self.items[tail] = item
+        self.tail = nxt  # publish only after the item is stored
+        return True
+
+    @micropython.native
+    def get(self):
+        """
+        :return: oldest item or None when empty
+        """
+        head = self.head
+        if head == self.tail:
+            return None
+        item = self.items[head]
+        self.items[head] = None
+        head += 1
+        if head == self.size:
+            head = 0
+        self.head = head
+        return item
+
+    @micropython.native
+    def __len__(self):
+        return (self.tail - self.head) % self.size
+
+
+class Future:
+    """
+    Result of work executed on CPU2. Await it from a uasyncio task, or poll done.
+    """
+
+    def __init__(self, id, fcn, nargs, kwargs):
+        self.id = id
+        self.fcn = fcn
+        self.nargs = nargs
+        self.kwargs = kwargs
+        self.done = False
+        self.result = None
+        self.exception = None
+        self.flag = uasyncio.ThreadSafeFlag()
+
+    def _run(self):  # executed on CPU2
+        try:
+            self.result = self.fcn(*self.nargs, **self.kwargs)
+        except Exception as e:
+            self.exception = e
+        self.fcn = self.nargs = self.kwargs = None
+        self.done = True
+        self.flag.set()
+
+    async def wait(self):
+        while not self.done:
+            await self.flag.wait()
+        if self.exception is not None:
+            raise self.exception
+        return self.result
+
+    def __await__(self):
+        return self.wait()
+
+    __iter__ = __await__
+
 
 class __CPU2:
     """
     As micropython uses a GIL, there is no CPU advantage that multi threaded gives v.s. async
+    Work is executed on the second core in submission order from a bounded FIFO queue.
     """
     _instance = None
 
@@ -22,37 +111,53 @@ class __CPU2:
 
     has_instance = False
 
-    def __init__(self):  # as its a singleton, this is run only once
+    def __init__(self, queue_size=16, single_producer=False, idle_us=50):
+        """
+        As its a singleton, this is run only once
+        :param queue_size: maximum number of pending work items
+        :param single_producer: only one thread on CPU1 submits work, so no lock is needed
+        :param idle_us: time CPU2 waits before checking the queue again when there is no work
+        """
         self.id = 0
-        self.completed = -1
-        self.tasks = []
-        self.task_lock = _thread.allocate_lock()
+        self.completed = 0  # number of completed work items
+        self.queue = RingQueue(queue_size)
+        self.task_lock = None if single_producer else _thread.allocate_lock()
+        self.idle_us = idle_us
 
         _thread.start_new_thread(self.monitor, ())
         print('CPU2 ready to process tasks..')
 
     def monitor(self):
+        queue = self.queue
         while True:
-            with self.task_lock:
-                if len(self.tasks) == 0:
-                    task = None
-                else:
-                    task = self.tasks.pop()
-            if task is not None:
-                task[1](*task[2], **task[3])
-                with self.task_lock:
-                    self.completed = task[0]
-            time.sleep_us(100)
-
-    def add_task(self, task_fcn, *nargs, **kwargs):
+            future = queue.get()
+            if future is None:
+                time.sleep_us(self.idle_us)
+            else:
+                future._run()
+                self.completed += 1
+
+    def submit(self, task_fcn, *nargs, **kwargs) -> Future:
+        """
+        Queue task_fcn(*nargs, **kwargs) for execution on CPU2
+        :return: Future that can be awaited for the result
+        """
+        if self.task_lock is None:
+            return self._submit(task_fcn, nargs, kwargs)
         with self.task_lock:
-            self.id += 1
-            self.tasks.append((self.id, task_fcn, nargs, kwargs))
-            id = self.id
-        return id
+            return self._submit(task_fcn, nargs, kwargs)
+
+    def _submit(self, task_fcn, nargs, kwargs):
+        self.id += 1
+        future = Future(self.id, task_fcn, nargs, kwargs)
+        if not self.queue.put(future):
+            raise Exception('CPU2 queue is full (%i tasks pending)' % len(self.queue))
+        return future
+
+    add_task = submit
 
-    def is_complete(self, task_id):
-        return task_id <= self.completed
+    def is_complete(self, future: Future):
+        return future.done
 
 
 CPU2 = __CPU2()
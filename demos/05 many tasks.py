@@ -0,0 +1,44 @@
+import time
+
+from async_runner import add_task, start_tasks, use_scheduler
+
+# Running lots of tasks at 60hz. Each task normally gets its own coroutine that is woken
+# up by uasyncio for every yield. With use_scheduler() all tasks share a single coroutine
+# that advances every task that is due in one go.
+# tests/bench_scheduler.py measures the same coroutine switches/s on a PC.
+
+# HARDWARE SETUP:
+#  Just your pi pico (w) and nothing else
+
+NR_TASKS = 50  # try 10, 50 and 200
+
+# Opt in to the scheduler *****************************************************
+scheduler = use_scheduler()  # without the scheduler every step is a coroutine switch
+
+
+# Define the tasks ************************************************************
+
+def frame(freq=60):
+    delay_ms = 1000 // freq
+    while True:
+        yield delay_ms
+
+
+def report(time_between_report_ms=2000):
+    yield time_between_report_ms
+    while True:
+        steps, wakeups = scheduler.steps, scheduler.wakeups
+        start = time.ticks_ms()
+        yield time_between_report_ms
+        seconds = time.ticks_diff(time.ticks_ms(), start) / 1000
+        print('%i tasks   steps/s: %6.1f   coroutine switches/s: %6.1f' % (
+            NR_TASKS, (scheduler.steps - steps) / seconds, (scheduler.wakeups - wakeups) / seconds))
+
+
+# Add the tasks *****************************************************************
+for _ in range(NR_TASKS):
+    add_task(frame)
+add_task(report)
+
+# start all the tasks ***********************************************************
+start_tasks()
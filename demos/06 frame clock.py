@@ -0,0 +1,60 @@
+from frame_clock import FrameClock
+
+# Several patterns stepped from one frame clock stay phase locked: deadlines are absolute
+# timestamps, so a rounded 1000 // 60 = 16ms delay does not add up to a drift.
+# This runs 10 minutes of simulated time in a few seconds and checks every segment.
+
+# HARDWARE SETUP:
+#  Just your pi pico (w) and nothing else
+
+SIMULATED_MS = 10 * 60 * 1000
+NR_SEGMENTS = 4
+
+
+# Stand-in patterns that record when they are stepped *******************************
+
+def recorder(clock, steps, delay_ms):
+    while True:
+        steps.append(clock.now)
+        if len(steps) > 2:
+            del steps[0]  # only the last steps are needed for the check
+        yield delay_ms
+
+
+# Phase locked at a target frame rate *********************************************
+def check_fps(fps):
+    clock = FrameClock(simulated=True)
+    steps = [[] for _ in range(NR_SEGMENTS)]
+    subscriptions = [clock.subscribe(recorder(clock, s, 1), fps) for s in steps]
+
+    frames = clock.run()
+    while clock.now < SIMULATED_MS:
+        next(frames)
+
+    expected = (clock.now * fps) // 1000  # frames on the exact grid
+    ok = all([s.steps in (expected, expected + 1) for s in subscriptions])
+    ok = ok and all([s[-1] == steps[0][-1] for s in steps])  # all stepped in the same frame
+    print('%i fps: %i clock frames, segment steps %s, expected %i: %s' % (
+        fps, clock.frames, [s.steps for s in subscriptions], expected, 'OK' if ok else 'FAILED'))
+    return ok
+
+
+# Phase locked with the delays the patterns yield **********************************
+def check_delays():
+    clock = FrameClock(simulated=True)
+    steps = [[] for _ in range(NR_SEGMENTS)]
+    subscriptions = [clock.subscribe(recorder(clock, s, 1000 // 60)) for s in steps]
+
+    frames = clock.run()
+    while clock.now < SIMULATED_MS:
+        next(frames)
+
+    ok = all([s.deadline == subscriptions[0].deadline for s in subscriptions])
+    ok = ok and clock.frames == subscriptions[0].steps  # one frame for all segments together
+    print('16ms delays: %i clock frames, segment steps %s: %s' % (
+        clock.frames, [s.steps for s in subscriptions], 'OK' if ok else 'FAILED'))
+    return ok
+
+
+results = [check_fps(60), check_fps(30), check_fps(24), check_delays()]
+print('phase locked' if all(results) else 'NOT phase locked')
@@ -0,0 +1,431 @@
+# MIT License (MIT)
+# Copyright (c) 2022 Bart-Floris Visscher
+# https://opensource.org/licenses/MIT
+
+# DMA transfer descriptors: the CTRL word, addresses and transfer count are computed once, so starting a
+# transfer is a few plain register writes and restarting it a single one, instead of a read-modify-write per
+# bit field. Registers are accessed through a backend: MemRegisters on the rp2040, SimRegisters to run and
+# check transfers on any python (no micropython or uctypes needed for this module).
+#
+# Used by hardware.py, see DMAChannel.start() and _DMA.chain()
+
+
+DMA_BASE = 0x50000000
+DMA_CHAN_WIDTH = 0x40
+DMA_CHAN_COUNT = 12
+MULTI_CHAN_TRIGGER = 0x430
+
+# channel registers, the same 4 registers are mapped in 4 orders, the last of each alias triggers [2.5.2.1]
+READ_ADDR = 0x00
+WRITE_ADDR = 0x04
+TRANS_COUNT = 0x08
+CTRL_TRIG = 0x0c
+AL1_CTRL = 0x10
+AL1_TRANS_COUNT_TRIG = 0x1c
+AL2_READ_ADDR = 0x28
+AL2_WRITE_ADDR_TRIG = 0x2c
+AL3_READ_ADDR_TRIG = 0x3c
+
+# CTRL register [2.5.7]
+CTRL_EN = 1 << 0
+CTRL_HIGH_PRIORITY = 1 << 1
+CTRL_DATA_SIZE = 2
+CTRL_INCR_READ = 1 << 4
+CTRL_INCR_WRITE = 1 << 5
+CTRL_RING_SIZE = 6
+CTRL_RING_SEL = 1 << 10
+CTRL_CHAIN_TO = 11
+CTRL_TREQ_SEL = 15
+CTRL_IRQ_QUIET = 1 << 21
+CTRL_BSWAP = 1 << 22
+CTRL_BUSY = 1 << 24
+
+DMA_SIZE_8 = 0
+DMA_SIZE_16 = 1
+DMA_SIZE_32 = 2  # the CTRL field value, DATA_SIZE is a 2 bit field: 0, 1 or 2
+
+TREQ_UNPACED = 0x3f
+
+# peripheral data registers and their dreq [2.5.3.1]
+PIO_BASE = (0x50200000, 0x50300000)
+PIO_TXF = 0x10
+PIO_RXF = 0x20
+SPI_BASE = (0x4003c000, 0x40040000)
+SPI_SSPDR = 0x08
+UART_BASE = (0x40034000, 0x40038000)
+UART_UARTDR = 0x00
+I2C_BASE = (0x40044000, 0x40048000)
+I2C_IC_DATA_CMD = 0x10
+ADC_FIFO = 0x4004c00c
+DREQ_PIO_TX = (0x00, 0x08)  # + state machine
+DREQ_PIO_RX = (0x04, 0x0c)
+DREQ_SPI_TX = (0x10, 0x12)
+DREQ_SPI_RX = (0x11, 0x13)
+DREQ_UART_TX = (0x14, 0x16)
+DREQ_UART_RX = (0x15, 0x17)
+DREQ_I2C_TX = (0x20, 0x22)
+DREQ_I2C_RX = (0x21, 0x23)
+DREQ_ADC = 0x24
+
+
+def ctrl_word(chain_to, data_size=DMA_SIZE_32, incr_read=True, incr_write=True, treq=TREQ_UNPACED, ring_size=0,
+              ring_write=False, bswap=False, high_priority=True, irq_quiet=True):
+    """
+    :param chain_to: channel to trigger when done, the channel itself for no chaining
+    :param ring_size: wrap the read (or write with ring_write) address every 2 ** ring_size bytes, 0 is off
+    :return: value for the CTRL register of a channel, enabled
+    """
+    ctrl = CTRL_EN | data_size << CTRL_DATA_SIZE | ring_size << CTRL_RING_SIZE | chain_to << CTRL_CHAIN_TO | \
+        treq << CTRL_TREQ_SEL
+    if incr_read:
+        ctrl |= CTRL_INCR_READ
+    if incr_write:
+        ctrl |= CTRL_INCR_WRITE
+    if ring_write:
+        ctrl |= CTRL_RING_SEL
+    if bswap:
+        ctrl |= CTRL_BSWAP
+    if high_priority:
+        ctrl |= CTRL_HIGH_PRIORITY
+    if irq_quiet:
+        ctrl |= CTRL_IRQ_QUIET
+    return ctrl
+
+
+class MemRegisters:
+    """
+    Register backend of the rp2040 itself
+    """
+
+    def __init__(self):
+        import machine
+        import uctypes
+        self.mem32 = machine.mem32
+        self.addressof = uctypes.addressof
+
+    def write(self, address, value):
+        self.mem32[address] = value
+
+    def read(self, address):
+        return self.mem32[address]
+
+
+class SimRegisters:
+    """
+    Register backend that runs DMA transfers in software, to test descriptors and chains on any python.
+    Buffers are given an address with addressof(). Transfers complete as soon as they are triggered (pacing is
+    ignored) and follow chain_to. Writes to registers outside of the DMA block are logged in writes.
+    """
+
+    _RAM = 0x20000000
+
+    def __init__(self):
+        self.registers = {}  # address: value of peripheral and dma registers
+        self.reload = {}  # channel: transfer count loaded at a trigger
+        self.writes = []  # (address, value) written to peripheral registers by dma, in order
+        self.buffers = []  # (address, memoryview of the buffer as bytes)
+        self.next_address = self._RAM
+        self.pending = []  # triggered channels, run one after the other like the hardware does
+        self.running = False
+
+    def addressof(self, buffer):
+        for address, view in self.buffers:
+            if view.obj is buffer:
+                return address
+        address = self.next_address
+        view = memoryview(buffer).cast('B')
+        self.buffers.append((address, view))
+        self.next_address += (len(view) + 15) & ~15  # keep buffers aligned for rings
+        return address
+
+    def _buffer(self, address):
+        for base, view in self.buffers:
+            if base <= address < base + len(view):
+                return view, address - base
+        return None, 0
+
+    def _load(self, address, size):
+        view, offset = self._buffer(address)
+        if view is None:
+            return self.registers.get(address, 0)
+        return int.from_bytes(bytes(view[offset:offset + size]), 'little')
+
+    def _store(self, address, size, value):
+        view, offset = self._buffer(address)
+        if view is not None:
+            view[offset:offset + size] = (value & ((1 << (size << 3)) - 1)).to_bytes(size, 'little')
+        elif DMA_BASE <= address < DMA_BASE + 0x1000:
+            self.write(address, value)  # dma writing dma registers: control blocks
+        else:
+            self.registers[address] = value
+            self.writes.append((address, value))
+
+    @staticmethod
+    def _canonical(offset):
+        """
+        :return: (alias 0 offset of the register, True when it is a trigger register)
+        """
+        alias = offset & 0x30
+        reg = offset & 0x0c
+        order = (
+            (READ_ADDR, WRITE_ADDR, TRANS_COUNT, CTRL_TRIG),
+            (CTRL_TRIG, READ_ADDR, WRITE_ADDR, TRANS_COUNT),
+            (CTRL_TRIG, TRANS_COUNT, READ_ADDR, WRITE_ADDR),
+            (CTRL_TRIG, WRITE_ADDR, TRANS_COUNT, READ_ADDR),
+        )[alias >> 4]
+        return order[reg >> 2], reg == 0x0c
+
+    def read(self, address):
+        offset = address - DMA_BASE
+        if 0 <= offset < DMA_CHAN_COUNT * DMA_CHAN_WIDTH:
+            channel, reg = divmod(offset, DMA_CHAN_WIDTH)
+            reg, _ = self._canonical(reg)
+            address = DMA_BASE + channel * DMA_CHAN_WIDTH + reg
+        return self.registers.get(address, 0)
+
+    def write(self, address, value):
+        offset = address - DMA_BASE
+        if offset == MULTI_CHAN_TRIGGER:
+            self._run([ch for ch in range(DMA_CHAN_COUNT) if value & (1 << ch)])
+        elif 0 <= offset < DMA_CHAN_COUNT * DMA_CHAN_WIDTH:
+            channel, reg = divmod(offset, DMA_CHAN_WIDTH)
+            reg, trigger = self._canonical(reg)
+            self.registers[DMA_BASE + channel * DMA_CHAN_WIDTH + reg] = value
+            if reg == TRANS_COUNT:
+                self.reload[channel] = value
+            if trigger and value:  # writing 0 to a trigger register is a null trigger
+                self._run([channel])
+        else:
+            self.registers[address] = value
+
+    def _run(self, channels):
+        self.pending += channels
+        if self.running:  # triggered by a dma write, runs after the current channel
+            return
+        self.running = True
+        try:
+            while self.pending:
+                self._transfer(self.pending.pop(0))
+        finally:
+            self.running = False
+
+    def _transfer(self, channel):
+        base = DMA_BASE + channel * DMA_CHAN_WIDTH
+        ctrl = self.registers.get(base + CTRL_TRIG, 0)
+        if not ctrl & CTRL_EN:
+            return
+        size = 1 << ((ctrl >> CTRL_DATA_SIZE) & 3)
+        ring = (ctrl >> CTRL_RING_SIZE) & 0xf
+        ring_mask = (1 << ring) - 1 if ring else -1
+        read = self.registers.get(base + READ_ADDR, 0)
+        write = self.registers.get(base + WRITE_ADDR, 0)
+        count = self.reload.get(channel, 0)
+        while count:
+            value = self._load(read, size)
+            self._store(write, size, value)
+            if ctrl & CTRL_INCR_READ:
+                read = self._step(read, size, ring_mask if not ctrl & CTRL_RING_SEL else -1)
+            if ctrl & CTRL_INCR_WRITE:
+                write = self._step(write, size, ring_mask if ctrl & CTRL_RING_SEL else -1)
+            count -= 1
+        self.registers[base + READ_ADDR] = read
+        self.registers[base + WRITE_ADDR] = write
+        self.registers[base + TRANS_COUNT] = 0
+        chain_to = (ctrl >> CTRL_CHAIN_TO) & 0xf
+        if chain_to != channel:
+            self.pending.append(chain_to)
+
+    @staticmethod
+    def _step(address, size, ring_mask):
+        if ring_mask == -1:
+            return address + size
+        return (address & ~ring_mask) | ((address + size) & ring_mask)
+
+
+class Descriptor:
+    """
+    One DMA transfer. Addresses are ints or buffers (the address is taken when the descriptor is bound).
+    """
+
+    def __init__(self, read, write, count=None, data_size=DMA_SIZE_32, incr_read=True, incr_write=True,
+                 treq=TREQ_UNPACED, ring_size=0, ring_write=False, bswap=False):
+        """
+        :param count: number of transfers, default the number of data_size items in the read (or write) buffer
+        """
+        if count is None:
+            buffer = write if isinstance(read, int) else read
+            count = (len(memoryview(buffer).cast('B')) if not isinstance(buffer, int) else 0) >> data_size
+        self.read = read
+        self.write = write
+        self.count = count
+        self.data_size = data_size
+        self.incr_read = incr_read
+        self.incr_write = incr_write
+        self.treq = treq
+        self.ring_size = ring_size
+        self.ring_write = ring_write
+        self.bswap = bswap
+
+        self.regs = None
+        self.channel = None
+        self.base = 0
+        self.read_addr = 0
+        self.write_addr = 0
+        self.ctrl = 0
+
+    def bind(self, channel, regs, chain_to=None):
+        """
+        Precompute the register values for a channel
+        :param chain_to: (None) channel to trigger when done
+        """
+        self.regs = regs
+        self.channel = channel
+        self.base = DMA_BASE + channel * DMA_CHAN_WIDTH
+        self.read_addr = self.read if isinstance(self.read, int) else regs.addressof(self.read)
+        self.write_addr = self.write if isinstance(self.write, int) else regs.addressof(self.write)
+        self.ctrl = ctrl_word(channel if chain_to is None else chain_to, self.data_size, self.incr_read,
+                              self.incr_write, self.treq, self.ring_size, self.ring_write, self.bswap)
+        return self
+
+    def block(self):
+        """
+        :return: [read, write, count, ctrl] register values, a control block for a chain
+        """
+        return [self.read_addr, self.write_addr, self.count, self.ctrl]
+
+    def load(self):
+        """
+        Write all registers without starting, start later (eg with a multi channel trigger) or with rearm()
+        """
+        regs = self.regs
+        base = self.base
+        regs.write(base + READ_ADDR, self.read_addr)
+        regs.write(base + WRITE_ADDR, self.write_addr)
+        regs.write(base + TRANS_COUNT, self.count)
+        regs.write(base + AL1_CTRL, self.ctrl)
+
+    def start(self):
+        regs = self.regs
+        base = self.base
+        regs.write(base + READ_ADDR, self.read_addr)
+        regs.write(base + WRITE_ADDR, self.write_addr)
+        regs.write(base + TRANS_COUNT, self.count)
+        regs.write(base + CTRL_TRIG, self.ctrl)
+
+    def rearm(self):
+        """
+        Start the transfer again after start() or load(), with a single register write when only one of the
+        addresses increments. The transfer count is reloaded by the trigger.
+        """
+        regs = self.regs
+        base = self.base
+        if self.incr_read:
+            if self.incr_write:
+                regs.write(base + WRITE_ADDR, self.write_addr)
+            regs.write(base + AL3_READ_ADDR_TRIG, self.read_addr)
+        elif self.incr_write:
+            regs.write(base + AL2_WRITE_ADDR_TRIG, self.write_addr)
+        else:
+            regs.write(base + CTRL_TRIG, self.ctrl)
+
+    def is_busy(self):
+        return self.regs.read(self.base + AL1_CTRL) & CTRL_BUSY
+
+
+class Chain:
+    """
+    Sequence of descriptors run one after the other on a data channel. A control channel writes each control
+    block into the registers of the data channel, the last write triggers it, and the data channel chains back
+    to the control channel for the next block. A block of zeros ends the chain [2.5.6.2].
+    """
+
+    def __init__(self, descriptors, data_channel, control_channel, regs):
+        import array
+        self.descriptors = descriptors
+        self.data_channel = data_channel
+        blocks = []
+        for descriptor in descriptors:
+            blocks += descriptor.bind(data_channel, regs, chain_to=control_channel).block()
+        blocks += [0, 0, 0, 0]
+        self.blocks = array.array('I', blocks)
+        data_registers = DMA_BASE + data_channel * DMA_CHAN_WIDTH  # alias 0, ends with CTRL_TRIG
+        self.control = Descriptor(self.blocks, data_registers, 4, ring_size=4, ring_write=True)
+        self.control.bind(control_channel, regs)
+
+    def update(self, i, descriptor=None):
+        """
+        Rewrite control block i, eg after changing the addresses or count of its descriptor
+        """
+        if descriptor is not None:
+            self.descriptors[i] = descriptor
+            descriptor.bind(self.data_channel, self.control.regs, chain_to=self.control.channel)
+        blocks = self.blocks
+        o = i << 2
+        for v in self.descriptors[i].block():
+            blocks[o] = v
+            o += 1
+
+    def start(self):
+        self.control.start()
+
+    def rearm(self):
+        self.control.rearm()
+
+    def is_busy(self):
+        return self.control.is_busy() or (self.descriptors and self.descriptors[0].is_busy())
+
+
+# Descriptors for the common transfers, buffers or addresses for memory
+
+def mem_2_mem(source, target, count=None, data_size=DMA_SIZE_32) -> Descriptor:
+    return Descriptor(source, target, count, data_size)
+
+
+def mem_2_pio(source, state_machine, count=None, data_size=DMA_SIZE_32) -> Descriptor:
+    block, sm = state_machine >> 2, state_machine & 3
+    return Descriptor(source, PIO_BASE[block] + PIO_TXF + (sm << 2), count, data_size, incr_write=False,
+                      treq=DREQ_PIO_TX[block] + sm)
+
+
+def pio_2_mem(state_machine, target, count=None, data_size=DMA_SIZE_32) -> Descriptor:
+    block, sm = state_machine >> 2, state_machine & 3
+    return Descriptor(PIO_BASE[block] + PIO_RXF + (sm << 2), target, count, data_size, incr_read=False,
+                      treq=DREQ_PIO_RX[block] + sm)
+
+
+def mem_2_spi(source, spi_id, count=None) -> Descriptor:
+    """
+    Enable the transmit dreq of the spi first (SSPDMACR bit 1), machine.SPI does not
+    """
+    return Descriptor(source, SPI_BASE[spi_id] + SPI_SSPDR, count, DMA_SIZE_8, incr_write=False,
+                      treq=DREQ_SPI_TX[spi_id])
+
+
+def spi_2_mem(spi_id, target, count=None) -> Descriptor:
+    return Descriptor(SPI_BASE[spi_id] + SPI_SSPDR, target, count, DMA_SIZE_8, incr_read=False,
+                      treq=DREQ_SPI_RX[spi_id])
+
+
+def mem_2_uart(source, uart_id, count=None) -> Descriptor:
+    return Descriptor(source, UART_BASE[uart_id] + UART_UARTDR, count, DMA_SIZE_8, incr_write=False,
+                      treq=DREQ_UART_TX[uart_id])
+
+
+def uart_2_mem(uart_id, target, count=None) -> Descriptor:
+    return Descriptor(UART_BASE[uart_id] + UART_UARTDR, target, count, DMA_SIZE_8, incr_read=False,
+                      treq=DREQ_UART_RX[uart_id])
+
+
+def mem_2_i2c(source, i2c_id, count=None) -> Descriptor:
+    """
+    :param source: 16 bit IC_DATA_CMD values (data byte, plus the stop/restart/read bits)
+    """
+    return Descriptor(source, I2C_BASE[i2c_id] + I2C_IC_DATA_CMD, count, DMA_SIZE_16, incr_write=False,
+                      treq=DREQ_I2C_TX[i2c_id])
+
+
+def adc_2_mem(target, count=None, data_size=DMA_SIZE_16) -> Descriptor:
+    """
+    Enable DREQ_EN in the ADC FCS register first, use DMA_SIZE_8 with the FCS SHIFT bit for 8 bit samples
+    """
+    return Descriptor(ADC_FIFO, target, count, data_size, incr_read=False, treq=DREQ_ADC)
@@ -0,0 +1,127 @@
+# MIT License (MIT)
+# Copyright (c) 2022 Bart-Floris Visscher
+# https://opensource.org/licenses/MIT
+
+# One time base for several patterns that render into the same pixel buffer. Deadlines are absolute frame
+# timestamps, so delays do not add up rounding errors or runner lateness, and all patterns that are due
+# (within coalesce_ms) are stepped in the same pass so the strip is sent once per frame.
+
+
+import time
+
+import micropython
+
+_REBASE_MS = 0x10000000  # keep timestamps small ints, rebase after ~3 days
+_FOREVER = 0x3fffffff
+
+
+class Subscription:
+    def __init__(self, iterator, fps, now):
+        """
+        :param fps: (None) step at this frame rate, the delays yielded by the pattern are ignored.
+                    None steps the pattern after the delay it yields.
+        """
+        self.iterator = iterator
+        self.fps = fps
+        self.start = now  # timestamp of frame 0
+        self.frame = 0
+        self.deadline = now
+        self.steps = 0
+        self.skipped = 0  # fps frames skipped because the clock was late
+
+    @micropython.native
+    def step(self, now):
+        delay = next(self.iterator)
+        self.steps += 1
+        fps = self.fps
+        if not fps:
+            self.deadline += delay  # absolute, so a late frame does not shift the following ones
+            return
+        frame = self.frame + 1
+        deadline = self.start + (frame * 1000) // fps
+        if deadline <= now:  # late, continue at the next frame on the grid instead of catching up
+            behind = ((now - self.start) * fps) // 1000 + 1
+            self.skipped += behind - frame
+            frame = behind
+            deadline = self.start + (frame * 1000) // fps
+        if frame >= fps * 60:  # whole minute, exact in ms, keeps frame * 1000 a small int
+            frame -= fps * 60
+            self.start += 60000
+        self.frame = frame
+        self.deadline = deadline
+
+
+class FrameClock:
+    def __init__(self, coalesce_ms=2, simulated=False):
+        """
+        :param coalesce_ms: subscriptions due within this many ms are stepped in the current frame
+        :param simulated: time only advances by the delays yielded from run(), for testing without a runner
+        """
+        self.now = 0  # ms timestamp of the current frame, only moves forward
+        self.coalesce_ms = coalesce_ms
+        self.simulated = simulated
+        self.subscriptions = []
+        self.frames = 0
+        self._ticks = time.ticks_ms()
+
+    def subscribe(self, iterator, fps=None) -> Subscription:
+        """
+        :param iterator: pattern iterator yielding delays in ms
+        """
+        subscription = Subscription(iter(iterator), fps, self.now)
+        self.subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self.subscriptions.remove(subscription)
+        if hasattr(subscription.iterator, 'close'):
+            subscription.iterator.close()
+        subscription.iterator = None
+
+    @micropython.native
+    def tick(self) -> int:
+        """
+        Step all subscriptions that are due
+        :return: ms until the next subscription is due
+        """
+        now = self.now
+        due = now + self.coalesce_ms
+        next_deadline = now + _FOREVER
+        for subscription in self.subscriptions:
+            if subscription.deadline <= due:
+                subscription.step(now)
+            if subscription.deadline < next_deadline:
+                next_deadline = subscription.deadline
+        self.frames += 1
+        delay_ms = next_deadline - now
+        return delay_ms if delay_ms > 0 else 0
+
+    @micropython.native
+    def advance(self, delay_ms):
+        if self.simulated:
+            self.now += delay_ms
+        else:
+            ticks = time.ticks_ms()
+            self.now += time.ticks_diff(ticks, self._ticks)
+            self._ticks = ticks
+        if self.now > _REBASE_MS:
+            self._rebase(_REBASE_MS >> 1)
+
+    def _rebase(self, offset):
+        self.now -= offset
+        for subscription in self.subscriptions:
+            subscription.start -= offset
+            subscription.deadline -= offset
+
+    def run(self, max_delay_ms=None):
+        """
+        Pattern generator that steps the subscriptions
+        :param max_delay_ms: (None) yield at least this often, e.g. to poll for changes between steps
+        """
+        self._ticks = time.ticks_ms()
+        while True:
+            delay_ms = self.tick()
+            if max_delay_ms is not None and delay_ms > max_delay_ms:
+                delay_ms = max_delay_ms
+            yield delay_ms
+            self.advance(delay_ms)
@@ -7,14 +7,19 @@
 #   The aim is to have different types of dma transfers readily available
 #   to and from all the different options ie
 #   mem -> mem, pio -> mem mem -> pio, mem->i2c etc
+#   dma_descriptors has descriptors for all of them, start them with DMAChannel.start() or dma.chain()
 #
 
 
+import array
 import os
 
+import machine
 import micropython
 from uctypes import BF_POS, BF_LEN, UINT32, BFUINT32, struct, addressof
 
+import dma_descriptors
+
 PIO0_BASE = const(0x50200000)
 PIO1_BASE = const(0x50300000)
 
@@ -46,6 +51,16 @@ ADC_BASE = const(0x4004c000)
 DMA_BASE = const(0x50000000)
 DMA_CHAN_WIDTH = const(0x40)
 DMA_CHAN_COUNT = const(12)
+DMA_AL2_READ_ADDR = const(0x28)  # alias 2 of a channel: READ_ADDR followed by WRITE_ADDR_TRIG [2.5.7]
+
+SPI0_BASE = const(0x4003c000)
+SPI1_BASE = const(0x40040000)
+SPI_SSPDR = const(0x08)  # data register
+SPI_SSPDMACR = const(0x24)  # dma control, bit 1 enables the transmit dreq
+
+PWM_BASE = const(0x40050000)
+PWM_SLICE_WIDTH = const(0x14)
+PWM_CC = const(0x0c)  # compare value register of a slice: channel A in the low, channel B in the high 16 bits
 
 DMA_SIZE_8 = const(0)
 DMA_SIZE_16 = const(1)
@@ -244,7 +259,8 @@ TREQ_UNPACED = 0x3f
 
 class DMAChannel:
     def __init__(self, channel_id, dma):
-        self.allocated = channel_id <= 1 and 'Pico W' in os.uname()[-1]  # used by wireless
+        self.reserved = channel_id <= 1 and 'Pico W' in os.uname()[-1]  # used by wireless
+        self.allocated = self.reserved
         self.dma = dma
         self.id = channel_id
         self.mask = 1 << channel_id
@@ -271,6 +287,15 @@ class DMAChannel:
         self._internals.CTRL.RING_SEL = 0
         self._internals.CTRL.RING_SIZE = 0
 
+    def release(self):
+        """
+        Return an allocated channel so it can be allocated again
+        """
+        if self.is_busy():
+            self.abort()
+        self.reset()  # ring, chain and other settings of a descriptor would confuse the next user
+        self.allocated = self.reserved
+
     def byteswap(self, enabled=None):
         if enabled is not None:
             self._internals.CTRL.BSWAP = enabled
@@ -316,8 +341,27 @@ class DMAChannel:
         self._internals.WRITE_ADDR_REG = addressof(target)
         self._internals.TRANS_COUNT_REG_TRIG = len(source)
 
+    def start(self, descriptor, chain_to=None):
+        """
+        Start a dma_descriptors.Descriptor on this channel, start it again later with descriptor.rearm()
+        :param chain_to: (None) channel to trigger when done
+        """
+        descriptor.bind(self.id, registers, chain_to)
+        descriptor.start()
+        return descriptor
+
+    @micropython.native
+    def transfer_count(self):
+        """
+        :return: number of transfers left
+        """
+        return self._internals.TRANS_COUNT_REG
+
     @micropython.native
-    def mem_2_pio(self, source, pio_state_machine, data_size: int = DMA_SIZE_32):
+    def mem_2_pio(self, source, pio_state_machine, data_size: int = DMA_SIZE_32, trigger=True):
+        """
+        :param trigger: start the transfer, with False it is started later with dma.trigger(channel_mask)
+        """
         if pio_state_machine < 4:
             target = PIO0_BASE
             dreq = pio_state_machine
@@ -333,6 +377,25 @@ class DMAChannel:
         self._internals.CTRL.TREQ_SEL = dreq  # transfer at pace of pio
         self._internals.READ_ADDR_REG = addressof(source)
         self._internals.WRITE_ADDR_REG = target
+        if trigger:
+            self._internals.TRANS_COUNT_REG_TRIG = len(source)
+        else:
+            self._internals.TRANS_COUNT_REG = len(source)
+
+    @micropython.native
+    def mem_2_spi(self, source, spi_id):
+        """
+        Send bytes with a machine.SPI that was set up for writing, at the pace of the spi transmit fifo
+        """
+        base = SPI1_BASE if spi_id else SPI0_BASE
+        machine.mem32[base + SPI_SSPDMACR] |= 2  # transmit dreq, not enabled by machine.SPI
+
+        self._internals.CTRL.DATA_SIZE = DMA_SIZE_8
+        self._internals.CTRL.INCR_WRITE = 0
+        self._internals.CTRL.INCR_READ = 1
+        self._internals.CTRL.TREQ_SEL = DREQ_SPI1_TX if spi_id else DREQ_SPI0_TX
+        self._internals.READ_ADDR_REG = addressof(source)
+        self._internals.WRITE_ADDR_REG = base + SPI_SSPDR
         self._internals.TRANS_COUNT_REG_TRIG = len(source)
 
     @micropython.native
@@ -385,6 +448,37 @@ class _DMA:
     def __len__(self):
         return len(self._channels)
 
+    @micropython.native
+    def trigger(self, channel_mask):
+        """
+        Start the prepared transfers of all channels in channel_mask at the same time
+        """
+        self._internals.MULTI_CHAN_TRIGGER = channel_mask
+
+    def chain(self, descriptors) -> dma_descriptors.Chain:
+        """
+        Allocates a data and a control channel that run the descriptors one after the other, start() or rearm()
+        the returned chain, release its channels with release_chain()
+        """
+        data = self.allocate_channel()
+        control = self.allocate_channel()
+        return dma_descriptors.Chain(descriptors, data.id, control.id, registers)
+
+    def release_chain(self, chain: dma_descriptors.Chain):
+        for channel in (chain.data_channel, chain.control.channel):
+            self._channels[channel].release()
+
+    @micropython.native
+    def busy(self, channel_mask) -> int:
+        """
+        :return: mask of the channels in channel_mask that are still transferring
+        """
+        busy = 0
+        for ch in self._channels:
+            if ch.mask & channel_mask and ch.is_busy():
+                busy |= ch.mask
+        return busy
+
     @micropython.native
     def allocate_channel(self) -> DMAChannel:
         ch = self.unused_channel()
@@ -410,4 +504,106 @@ class _DMA:
         return self.unused_channel().mem_2_pio(source, state_machine_id, data_size=data_size)
 
 
+registers = dma_descriptors.MemRegisters()  # register backend for dma_descriptors
 dma = _DMA(channels=DMA_CHAN_COUNT)
+
+
+class PWMScatter:
+    """
+    Writes the duty cycles of many PWM pins with DMA, without a Python call per pin. The duty cycles are packed
+    into one compare (CC) word per PWM slice. A control channel feeds (read address, write address) blocks to
+    a data channel that copies each CC word to its slice register; a null block ends the chain [2.5.6.2].
+    Both channels of a slice are written, so don't use the other channel of a slice for something else.
+    """
+
+    def __init__(self, pin_ids, pace=False):
+        """
+        :param pin_ids: gpio numbers, in the order of the duty cycle buffer
+        :param pace: write each slice at the wrap of the first pin's slice (DREQ_PWM_WRAP), default as fast as possible
+        """
+        slices = []
+        for pin in pin_ids:
+            slc = (pin >> 1) & 7
+            if slc not in slices:
+                slices.append(slc)
+        self.slices = slices
+        # index of the 16 bit half of the compare image for each pin
+        self.map = bytearray([(slices.index((pin >> 1) & 7) << 1) | (pin & 1) for pin in pin_ids])
+        self.cc = array.array('I', [0 for _ in slices])  # compare register image, one word per slice
+
+        # control blocks: (address in the image, address of the slice CC register) and a null block
+        cc_address = addressof(self.cc)
+        blocks = []
+        for i, slc in enumerate(slices):
+            blocks.append(cc_address + (i << 2))
+            blocks.append(PWM_BASE + slc * PWM_SLICE_WIDTH + PWM_CC)
+        blocks.append(0)
+        blocks.append(0)
+        self.control_blocks = array.array('I', blocks)
+
+        self.data = dma.allocate_channel()
+        self.control = dma.allocate_channel()
+
+        data = self.data._internals
+        data.CTRL.DATA_SIZE = DMA_SIZE_32
+        data.CTRL.INCR_READ = 0
+        data.CTRL.INCR_WRITE = 0
+        data.CTRL.TREQ_SEL = DREQ_PWM_WRAP0 + slices[0] if pace else TREQ_UNPACED
+        data.CTRL.CHAIN_TO = self.control.id  # fetch the next block after every word
+        data.TRANS_COUNT_REG = 1
+
+        control = self.control._internals
+        control.CTRL.DATA_SIZE = DMA_SIZE_32
+        control.CTRL.INCR_READ = 1
+        control.CTRL.INCR_WRITE = 1
+        control.CTRL.RING_SEL = 1  # wrap the write address ..
+        control.CTRL.RING_SIZE = 3  # .. every 8 bytes: READ_ADDR and WRITE_ADDR_TRIG of the data channel
+        control.CTRL.TREQ_SEL = TREQ_UNPACED
+        control.WRITE_ADDR_REG = DMA_BASE + self.data.id * DMA_CHAN_WIDTH + DMA_AL2_READ_ADDR
+        control.TRANS_COUNT_REG = 2
+
+    @micropython.viper
+    def _pack(self, duty):
+        src = ptr16(duty)
+        dst = ptr16(self.cc)
+        idx = ptr8(self.map)
+        n = int(len(self.map))
+        i = 0
+        while i < n:
+            dst[idx[i]] = src[i]
+            i += 1
+
+    @micropython.native
+    def is_busy(self):
+        return self.control.is_busy() or self.data.is_busy()
+
+    @micropython.native
+    def commit(self, duty) -> bool:
+        """
+        :param duty: array('H') with a 16 bit duty cycle per pin (eg PixelBufferPWM.buf)
+        :return: False when the previous commit is still running (only possible when paced)
+        """
+        if self.is_busy():
+            return False
+        self._pack(duty)
+        self.control._internals.READ_ADDR_REG = addressof(self.control_blocks)
+        self.control._internals.TRANS_COUNT_REG_TRIG = 2
+        return True
+
+    def register_image(self):
+        """
+        :return: {register address: value} the chain writes, walked like the DMA does. Compare against
+                 machine.mem32[address] to verify the transfer.
+        """
+        image = {}
+        blocks = self.control_blocks
+        mem = {addressof(self.cc) + (i << 2): v for i, v in enumerate(self.cc)}
+        i = 0
+        while blocks[i + 1]:  # null trigger ends the chain
+            image[blocks[i + 1]] = mem[blocks[i]]
+            i += 2
+        return image
+
+    def release(self):
+        self.control.release()
+        self.data.release()
@@ -0,0 +1,99 @@
+# MIT License (MIT)
+# Copyright (c) 2022 Bart-Floris Visscher
+# https://opensource.org/licenses/MIT
+
+# Precomputed 256 entry colour tables in the PixelBufferNeo word format.
+# Patterns index them by position or time with integer maths only.
+
+
+import array
+
+import micropython
+
+from pixel_buffers import PixelBufferSegment, packed_pixel
+
+
+class Palette:
+    def __init__(self, table):
+        """
+        :param table: 256 packed pixel words (array('I'))
+        """
+        self.table = table
+        self.offset = 0
+        self.step = 256
+
+    @micropython.native
+    def __len__(self):
+        return 256
+
+    @micropython.native
+    def __getitem__(self, i: int):
+        return self.table[i & 0xff]
+
+    def render(self, pixel_buffer, offset=0, step=256):
+        """
+        Fill the pixel buffer with palette colours
+        :param offset: palette index of the first pixel
+        :param step: palette index increment per pixel in 1/256th (256 is one palette entry per pixel)
+        """
+        start = 0
+        buf = pixel_buffer
+        while isinstance(buf, PixelBufferSegment):
+            start += buf.start
+            buf = buf.buf
+        end = start + len(pixel_buffer)
+        buf.mark_dirty(start, end)
+        self.offset = offset
+        self.step = step
+        self._render(buf.buf, start, end)
+
+    @micropython.viper
+    def _render(self, buf, start: int, end: int):
+        dst = ptr32(buf)
+        table = ptr32(self.table)
+        step = int(self.step)
+        pos = int(self.offset) << 8
+        while start < end:
+            dst[start] = table[(pos >> 8) & 0xff]
+            pos += step
+            start += 1
+
+
+def hsv_to_rgb(h, s, v):
+    """
+    :param h: hue 0-255, s: saturation 0-255, v: value 0-255
+    :return: [r, g, b]
+    """
+    if s == 0:
+        return [v, v, v]
+    region = h * 6 // 256
+    remainder = (h * 6) - region * 256
+    p = (v * (255 - s)) >> 8
+    q = (v * (255 - ((s * remainder) >> 8))) >> 8
+    t = (v * (255 - ((s * (255 - remainder)) >> 8))) >> 8
+    return [[v, t, p], [q, v, p], [p, v, t], [p, q, v], [t, p, v], [v, p, q]][region]
+
+
+def hsv_wheel(saturation=255, value=255) -> Palette:
+    table = array.array('I', bytearray(1024))
+    for i in range(256):
+        table[i] = packed_pixel(*hsv_to_rgb(i, saturation, value))
+    return Palette(table)
+
+
+def gradient(stops) -> Palette:
+    """
+    :param stops: list of (position 0-255, [r, g, b] or [r, g, b, w]) sorted by position, the gradient wraps
+                  from the last to the first stop
+    """
+    table = array.array('I', bytearray(1024))
+    n = len(stops)
+    for s in range(n):
+        pos1, pixel1 = stops[s]
+        pos2, pixel2 = stops[(s + 1) % n]
+        length = (pos2 - pos1) % 256 or 256
+        channels = len(pixel1)
+        for i in range(length):
+            value = [pixel1[c] + ((pixel2[c] - pixel1[c]) * i) // length for c in range(channels)]
+            table[(pos1 + i) & 0xff] = packed_pixel(*value)
+    return Palette(table)
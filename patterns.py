@@ -8,33 +8,27 @@ import time
 
 import uasyncio
 
+import compositor
+import frame_clock
 import hass_entities
+import palettes
 from gbl import make_slice
 from pixel_buffers import PixelBuffer, PixelBufferSegment
 
 
 def hass_lightstrip(pixel_buffer: PixelBuffer, name, mqtt: hass_entities.HomeAssistantMQTT, patterns=dict(),
-                    brightness=255, default_pattern='monotone'):
+                    brightness=255, default_pattern='monotone', transition_ms=0, transition=compositor.FADE):
+    """
+    :param transition_ms: (0 is a hard cut) duration of the transition between effects
+    :param transition: compositor.FADE, WIPE or DISSOLVE
+    """
     if pixel_buffer.bpp == 3:
         color_mode = "rgb"
     else:
         color_mode = "rgbw"
 
-    class PixelValuewithBrightness:
-        def __init__(self, lst):
-            self.lst = lst
-
-        def __setitem__(self, key, value):
-            self.lst[key] = value
-
-        def __getitem__(self, item):
-            nonlocal brightness
-            return self.lst[item] * brightness // 255
-
-        def __len__(self):
-            return len(self.lst)
-
-    single_color = PixelValuewithBrightness(pixel_buffer.max_pixel_value)
+    single_color = list(pixel_buffer.max_pixel_value)
+    pixel_buffer.set_brightness(brightness)  # applied when sending, patterns keep full resolution
 
     def replace_pixel_in_patterns(list_or_dict):
         if isinstance(list_or_dict, dict):
@@ -50,21 +44,9 @@ def hass_lightstrip(pixel_buffer: PixelBuffer, name, mqtt: hass_entities.HomeAss
         for arg, val in pattern_args.items():  # holds pattern arguments in dict
             if 'pattern' in arg:
                 replace_pixel_in_patterns(val)
-            elif 'pixel' in arg:
-                if isinstance(val, (list, tuple)):
-
-                    # check if it matches a list of pixels
-                    if all([isinstance(pixel, (list, tuple)) and len(pixel) == pixel_buffer.bpp and
-                            all([isinstance(p, int) for p in pixel]) for pixel in val]):
-                        # list of pixels
-
-                        val = pattern_args[arg] = [PixelValuewithBrightness(pixel) for pixel in val]
-                    elif len(val) == pixel_buffer.bpp and all([isinstance(p, int) for p in val]):
-                        # single pixel
-                        if arg == 'pixel' and isinstance(val, list):
-                            pattern_args[arg] = single_color
-                        else:
-                            pattern_args[arg] = PixelValuewithBrightness(val)
+            elif arg == 'pixel' and isinstance(val, list) and len(val) == pixel_buffer.bpp and \
+                    all([isinstance(p, int) for p in val]):
+                pattern_args[arg] = single_color  # single pixel follows the colour set in hass
 
     replace_pixel_in_patterns(patterns)  # in place update
 
@@ -74,7 +56,6 @@ def hass_lightstrip(pixel_buffer: PixelBuffer, name, mqtt: hass_entities.HomeAss
     def command_callback(entity, command):
         nonlocal brightness
         nonlocal current_pattern
-        nonlocal single_color
         print(entity.name + ' received command : %s' % command)
         entity.state['state'] = command['state']  # always part of the command from hass
         effect = command.get('effect', entity.state.get('effect', current_pattern))
@@ -84,10 +65,11 @@ def hass_lightstrip(pixel_buffer: PixelBuffer, name, mqtt: hass_entities.HomeAss
         if color:
             for i, c in enumerate(color_mode):
                 single_color[i] = color.get(c, 0)
-        command['color'] = {c: single_color.lst[i] for i, c in enumerate(color_mode)}
+        command['color'] = {c: single_color[i] for i, c in enumerate(color_mode)}
 
-        if 'brightness' in command:
+        if 'brightness' in command and command['brightness'] != brightness:
             brightness = command['brightness']
+            pixel_buffer.set_brightness(brightness)  # only rebuilds the lookup table
         entity.state['brightness'] = brightness
 
         entity.new_command.set()
@@ -100,6 +82,12 @@ def hass_lightstrip(pixel_buffer: PixelBuffer, name, mqtt: hass_entities.HomeAss
     entity.new_command = uasyncio.Event()
     current_pattern = default_pattern
 
+    if transition_ms:
+        switcher = compositor.Transition(pixel_buffer, transition_ms, transition)
+        iterator = switcher.run()
+    else:
+        switcher = None
+
     pixel_buffer.fade(0)  # start with all black
     yield 20
 
@@ -109,41 +97,102 @@ def hass_lightstrip(pixel_buffer: PixelBuffer, name, mqtt: hass_entities.HomeAss
         if on and effect != 'monotone':
             if current_pattern != effect and effect in patterns:
                 active_pattern = patterns[effect]
-                iterator = iter(active_pattern[0](pixel_buffer, **active_pattern[1]))
+                if switcher is None:
+                    iterator = iter(active_pattern[0](pixel_buffer, **active_pattern[1]))
+                else:
+                    switcher.switch(*active_pattern)
                 current_pattern = effect
             yield next(iterator)
         else:
+            if switcher is not None:
+                switcher.redraw()  # the pattern is copied back when the effect is shown again
             if on:  # monotone
                 pixel_buffer.fill(single_color)
             else:  # off
                 pixel_buffer.fade(0)
             entity.new_command.clear()
-            yield entity.new_command.wait()
-
-
-def select_pattern(pixel_buffer: PixelBuffer, patterns, black_board, entry, freq=30):
+            yield entity.new_command  # the runner waits on the event without allocating a coroutine
+
+
+class PatternSlot:
+    """
+    Pattern of a driver that can be replaced while the driver keeps running: the state machine, DMA channel and
+    buffers of the driver stay set up, only the outgoing pattern is closed.
+        slot = PatternSlot(rainbow, speed=2)
+        task = add_task(neo_driver_dma, 0, slot, 144)
+        task.replace_pattern(strip_clock)  # or slot.replace_pattern(strip_clock)
+    """
+
+    def __init__(self, pattern, **kwargs):
+        self.pattern = pattern
+        self.kwargs = kwargs
+        self.replacements = 0
+        self._replacement = None
+
+    def replace_pattern(self, pattern, **kwargs):
+        """
+        Switch to pattern(pixel_buffer, **kwargs) at the next frame, the pixel buffer starts black
+        """
+        self._replacement = (pattern, kwargs)
+
+    def __call__(self, pixel_buffer: PixelBuffer, **kwargs):
+        if kwargs:  # pattern kwargs passed to the driver
+            kwargs.update(self.kwargs)
+            self.kwargs = kwargs
+        iterator = iter(self.pattern(pixel_buffer, **self.kwargs))
+        try:
+            while True:
+                if self._replacement is not None:
+                    iterator.close()
+                    self.pattern, self.kwargs = self._replacement
+                    self._replacement = None
+                    self.replacements += 1
+                    pixel_buffer.fill_range(0, pixel_buffer.n, 0)
+                    iterator = iter(self.pattern(pixel_buffer, **self.kwargs))
+                try:
+                    delay_ms = next(iterator)
+                except StopIteration:
+                    return
+                yield delay_ms
+        finally:  # driver stopped
+            iterator.close()
+
+
+def select_pattern(pixel_buffer: PixelBuffer, patterns, black_board, entry, freq=30, transition_ms=0,
+                   transition=compositor.FADE):
+    """
+    :param transition_ms: (0 is a hard cut) duration of the transition between patterns
+    :param transition: compositor.FADE, WIPE or DISSOLVE
+    """
     cycle_delay_ms = 1000 // freq
     current_pattern = None
 
     if black_board.get(entry, None) is None or black_board[entry] not in patterns:
         black_board[entry] = list(patterns.keys())[0]
 
-    cur_time = 0
-    pattern_delay = 0
+    if transition_ms:
+        switcher = compositor.Transition(pixel_buffer, transition_ms, transition, freq)
+        frames = switcher.run()
+        while True:
+            new_pattern = black_board.get(entry, current_pattern)
+            if current_pattern != new_pattern and new_pattern in patterns:
+                switcher.switch(*patterns[new_pattern])
+                current_pattern = new_pattern
+            yield next(frames)
+
+    clock = frame_clock.FrameClock()
+    frames = clock.run(cycle_delay_ms)  # polls the black board at least every cycle
+    subscription = None
     while True:
         new_pattern = black_board.get(entry, current_pattern)
         if current_pattern != new_pattern and new_pattern in patterns:
             active_pattern = patterns[new_pattern]
-            iterator = iter(active_pattern[0](pixel_buffer, **active_pattern[1]))
+            if subscription is not None:
+                clock.unsubscribe(subscription)
+            subscription = clock.subscribe(active_pattern[0](pixel_buffer, **active_pattern[1]))
             current_pattern = new_pattern
 
-        if pattern_delay <= cur_time:
-            pattern_delay += next(iterator)
-
-        delay_ms = min([pattern_delay - cur_time, cycle_delay_ms])
-
-        yield delay_ms
-        cur_time += delay_ms
+        yield next(frames)
 
 
 def blink(pixel_buffer: PixelBuffer, pixel=None, on_time_ms=200, off_time_ms=800):
@@ -260,12 +309,10 @@ def cylon(pixel_buffer: PixelBuffer, pixel=None, fade=0.85, freq=60):
     old_pos = -1
     l = len(pixel_buffer)
     cycle_delay_ms = 1000 // freq
-    if isinstance(pixel, int):
-        def fade_fcn(x):
-            return int(x * fade)
-    else:
-        def fade_fcn(x_list):
-            return [int(x * fade) for x in x_list]
+    fade_pixel_value = pixel_buffer.fade_pixel_value  # handles lists and packed pixels
+
+    def fade_fcn(x):
+        return fade_pixel_value(x, fade)
 
     while True:
         for cycle in range(2 * freq):
@@ -339,22 +386,22 @@ def morse_code(pixel_buffer: PixelBuffer, message, on_pixel=None, off_pixel=None
     }
     if reverse:
         def on():
-            # pixel_buffer.rotate_left(1)
+            pixel_buffer.shift(-1)
             pixel_buffer[-1] = on_pixel
             return dit
 
         def off():
-            # pixel_buffer.rotate_left(1)
+            pixel_buffer.shift(-1)
             pixel_buffer[-1] = off_pixel
             return dit
     else:
         def on():
-            # pixel_buffer.rotate_right(1)
+            pixel_buffer.shift(1)
             pixel_buffer[0] = on_pixel
             return dit
 
         def off():
-            # pixel_buffer.rotate_right(1)
+            pixel_buffer.shift(1)
             pixel_buffer[0] = off_pixel
             return dit
 
@@ -473,28 +520,40 @@ def attention(pixel_buffer: PixelBuffer, pixel=None, freq=60, fade=0.8):
         yield 500
 
 
-def multi_pattern(pixel_buffer: PixelBuffer, segment_sizes, segment_patterns):
+def multi_pattern(pixel_buffer: PixelBuffer, segment_sizes, segment_patterns, fps=None):
+    """
+    Patterns side by side on segments of the pixel buffer, stepped from one frame clock
+    :param fps: (None is the delays the patterns yield) step all segments at this frame rate, phase locked
+    """
     assert len(segment_sizes) == len(segment_patterns)
 
-    segments = []
+    clock = frame_clock.FrameClock()
+
     start = 0
-    for size in segment_sizes:
-        segments.append(PixelBufferSegment(pixel_buffer, start, start + size - 1))
+    for size, pat in zip(segment_sizes, segment_patterns):
+        segment = PixelBufferSegment(pixel_buffer, start, start + size - 1)
+        clock.subscribe(pat[0](segment, **pat[1]), fps)
         start += size
 
-    iterators = [iter(pat[0](seg, **pat[1])) for seg, pat in zip(segments, segment_patterns)]
-    delays = [0 for _ in iterators]
-
-    cur_time = 0
-    while True:
-        for i, itr in enumerate(iterators):
-            if delays[i] <= cur_time:
-                delays[i] += next(itr)
+    yield from clock.run()
 
-        delay_ms = min([d - cur_time for d in delays])
 
+def layered(pixel_buffer: PixelBuffer, layers, report_s=0):
+    """
+    Patterns on top of each other, blended into the pixel buffer
+    :param layers: list of compositor.Layer or (pattern, kwargs, mode, opacity, mask) tuples, bottom layer first
+    :param report_s: (0 is never) print the per layer render time every report_s seconds
+    """
+    layers = [layer if isinstance(layer, compositor.Layer) else compositor.Layer(*layer) for layer in layers]
+    comp = compositor.Compositor(pixel_buffer, layers)
+    report_at = report_s * 1000
+    cur_time = 0
+    for delay_ms in comp.run():
         yield delay_ms
         cur_time += delay_ms
+        if report_s and cur_time >= report_at:
+            comp.report()
+            report_at += report_s * 1000
 
 
 def clear(pixel_buffer: PixelBuffer, freq=60, wait_cycles=20):
@@ -511,12 +570,7 @@ def left_right_slow(pixel_buffer: PixelBuffer, lr_pixel, rl_pixel, speed=.5, fre
 
     n = len(pixel_buffer)
     pos = 0.0
-    if isinstance(lr_pixel, int):
-        def fade_fcn(x, si):
-            return int(x * si)
-    else:
-        def fade_fcn(x_list, si):
-            return [int(x * si) for x in x_list]
+    fade_fcn = pixel_buffer.fade_pixel_value  # handles lists and packed pixels
 
     while True:
         pixel_buffer.fade(fade)
@@ -588,3 +642,50 @@ def strip_clock(pixel_buffer: PixelBuffer):
             pixel_buffer.fade(0, centre_slice)  # clear centre pixel
 
         yield delay_ms
+
+
+def rainbow(pixel_buffer: PixelBuffer, palette=None, speed=2, spread=256, freq=60):
+    """
+    Moving rainbow (or any palette) over the whole strip, PixelBufferNeo only
+    :param speed: palette entries moved per frame
+    :param spread: palette entries spanned by the whole strip
+    """
+    if palette is None:
+        palette = palettes.hsv_wheel()
+
+    cycle_delay_ms = 1000 // freq
+    step = (spread << 8) // len(pixel_buffer)
+    offset = 0
+    while True:
+        palette.render(pixel_buffer, offset, step)
+        offset = (offset + speed) & 0xff
+        yield cycle_delay_ms
+
+
+def gradient_scroll(pixel_buffer: PixelBuffer, stops, speed=1, freq=60):
+    """
+    Multi stop gradient stretched over the strip and scrolling along it, PixelBufferNeo only
+    :param stops: list of (position 0-255, pixel) see palettes.gradient
+    """
+    yield from rainbow(pixel_buffer, palette=palettes.gradient(stops), speed=speed, spread=256, freq=freq)
+
+
+def palette_twinkle(pixel_buffer: PixelBuffer, palette=None, density=8, fade=220, freq=60):
+    """
+    Random pixels light up in palette colours and fade out, PixelBufferNeo only
+    :param density: pixels lit per frame per 256 pixels
+    :param fade: fade multiplier per frame 0-255
+    """
+    if palette is None:
+        palette = palettes.hsv_wheel()
+
+    cycle_delay_ms = 1000 // freq
+    n = len(pixel_buffer)
+    per_frame = (density * n) >> 8 or 1
+    hue = 0
+    while True:
+        pixel_buffer.fade_range(0, n, fade)
+        for _ in range(per_frame):
+            pixel_buffer[random.randint(0, n - 1)] = palette[hue + random.getrandbits(6)]
+        hue = (hue + 1) & 0xff
+        yield cycle_delay_ms
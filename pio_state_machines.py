@@ -44,3 +44,32 @@ def __SK6812__():
     label("do_zero")
     nop().side(0)[T2 - 1]
     wrap()
+
+
+_parallel_programs = {}
+
+
+def ws2812_parallel(n_pins):
+    """
+    State Machine Assembly for sending the bitstream to up to 8 LED strips on consecutive pins at once.
+    Every 8 bits (pulled as 4 per 32 bit word, lowest byte first) is one bit for each of the strips,
+    see pixel_buffers.BitPlanes. Run it at 8MHz, 10 cycles per bit.
+    """
+    program = _parallel_programs.get(n_pins)
+    if program is None:
+        @rp2.asm_pio(out_init=(rp2.PIO.OUT_LOW,) * n_pins, out_shiftdir=rp2.PIO.SHIFT_RIGHT, autopull=True,
+                     pull_thresh=32)
+        def __WS2812_PARALLEL__():
+            T1 = 2
+            T2 = 5
+            T3 = 3
+
+            wrap_target()
+            out(x, 8)
+            mov(pins, invert(null))[T1 - 1]  # all strips high
+            mov(pins, x)[T2 - 1]  # strips with a 0 bit go low early
+            mov(pins, null)[T3 - 2]  # all strips low
+            wrap()
+
+        program = _parallel_programs[n_pins] = __WS2812_PARALLEL__
+    return program
@@ -12,6 +12,53 @@ from gbl import make_slice
 FULL_SLICE = make_slice[:]
 
 
+def packed_pixel(r, g, b, w=0):
+    """
+    Pixel value as a single PixelBufferNeo word (G R B W from high to low byte). Precompute colours with it
+    once, so setting, filling and merging them is a single word store instead of a conversion per channel.
+    """
+    return (g << 24) | (r << 16) | (b << 8) | w
+
+
+def unpack_pixel(word, bpp=3):
+    """
+    :return: [r, g, b] or [r, g, b, w] list of a packed pixel value
+    """
+    if bpp == 3:
+        return [(word >> 16) & 0xff, (word >> 24) & 0xff, (word >> 8) & 0xff]
+    return [(word >> 16) & 0xff, (word >> 24) & 0xff, (word >> 8) & 0xff, word & 0xff]
+
+
+def bit_planes_reference(pixel_words, bits):
+    """
+    Plain python version of BitPlanes.transpose, to check it against
+    :param pixel_words: list with a list of packed pixel words per strip
+    :return: bytearray, byte k of pixel p has bit (31 - k) of the pixel word of every strip (strip i in bit i)
+    """
+    n = max([len(words) for words in pixel_words])
+    out = bytearray(n * bits)
+    for lane, words in enumerate(pixel_words):
+        for p, word in enumerate(words):
+            for k in range(bits):
+                if (word >> (31 - k)) & 1:
+                    out[p * bits + k] |= 1 << lane
+    return out
+
+
+def apa102_reference(pixel_words, bpp=3, brightness=31):
+    """
+    Plain python version of APA102Frame.encode, to check it against
+    :return: bytes of the whole frame: start frame, led frames and end frame
+    """
+    n = len(pixel_words)
+    out = bytearray(4)
+    for word in pixel_words:
+        level = (word & 0xff) >> 3 if bpp == 4 else brightness
+        out += bytes([0xe0 | level, (word >> 8) & 0xff, (word >> 24) & 0xff, (word >> 16) & 0xff])
+    out += bytearray(4 + (n + 15) // 16)
+    return out
+
+
 class PixelBuffer:
     def __init__(self, n, max_pixel_value, type='B'):
         """
@@ -20,6 +67,34 @@ class PixelBuffer:
         self.n = n
         self.buf = array.array(type, [0 for _ in range(n)])
         self.max_pixel_value = max_pixel_value
+        # pixels [dirty_start, dirty_end) changed since the last clean(), empty when dirty_start >= dirty_end
+        self.dirty_start = 0
+        self.dirty_end = n
+        self.frames_skipped = 0  # counted by drivers that skipped sending an unchanged buffer
+        self._blend_opacity = 255  # blend_from arguments, passed as attributes to keep the viper kernels at 4 args
+        self._blend_mask = None
+
+    @micropython.native
+    def mark_dirty(self, start, end):
+        if start < self.dirty_start:
+            self.dirty_start = start
+        if end > self.dirty_end:
+            self.dirty_end = end
+
+    @property
+    def dirty(self):
+        return self.dirty_start < self.dirty_end
+
+    @micropython.native
+    def clean(self):
+        """
+        :return: (start, end) range that changed since the last call
+        """
+        start = self.dirty_start
+        end = self.dirty_end
+        self.dirty_start = self.n
+        self.dirty_end = 0
+        return start, end
 
     @micropython.native
     def fade_pixel_value(self, value, fade):
@@ -42,10 +117,12 @@ class PixelBuffer:
     @micropython.native
     def __setitem__(self, idx, v):
         if isinstance(idx, slice):
-            for i in range(*idx.indices(self.n)):
-                self.buf[idx] = v
+            self.fill(v, idx)
         else:
             self.buf[idx] = v
+            if idx < 0:
+                idx += self.n
+            self.mark_dirty(idx, idx + 1)
 
     @micropython.native
     def __getitem__(self, i):
@@ -60,6 +137,7 @@ class PixelBuffer:
     @micropython.native
     def fill(self, v, slc=FULL_SLICE):
         i, n, s = slc.indices(self.n)
+        self.mark_dirty(i, n)
         buf = self.buf
         while i < n:
             buf[i] = v
@@ -67,6 +145,8 @@ class PixelBuffer:
 
     @micropython.native
     def fade(self, f, slc=FULL_SLICE):
+        i, n, _ = slc.indices(self.n)
+        self.mark_dirty(i, n)
         self._fade_nd(int(f * 1000), 1000, slc)
 
     @micropython.native
@@ -81,6 +161,170 @@ class PixelBuffer:
     def pixel_merge(self, i, p):
         buf = self.buf
         buf[i] = min(self.max_pixel_value, p + buf[i])
+        self.mark_dirty(i, i + 1)
+
+    # Bulk operations on pixel ranges [start, end). Subclasses implement the _kernels in viper,
+    # values are packed with pack() once so they can be stored as a single word per pixel.
+
+    @micropython.native
+    def pack(self, value):
+        """
+        :return: pixel value in the internal buffer format, for use with fill_range
+        """
+        return value
+
+    @micropython.native
+    def _clamp(self, start, end):
+        n = self.n
+        if end is None or end > n:
+            end = n
+        if start < 0:
+            start = 0
+        return start, end
+
+    @micropython.native
+    def fill_range(self, start, end, packed):
+        start, end = self._clamp(start, end)
+        self.mark_dirty(start, end)
+        self._fill_range(start, end, packed)
+
+    @micropython.native
+    def fade_range(self, start, end, multiplier: int):
+        """
+        :param multiplier: 0 (black) - 255 (unchanged)
+        """
+        start, end = self._clamp(start, end)
+        self.mark_dirty(start, end)
+        self._fade_range(start, end, multiplier)
+
+    @micropython.native
+    def add_from(self, other, start=0):
+        """
+        Saturating add of all pixels of other (same type of buffer) into this buffer from pixel start onwards
+        """
+        start, end = self._clamp(start, start + other.n)
+        self.mark_dirty(start, end)
+        self._add_from(other.buf, start, end)
+
+    @micropython.native
+    def copy_from(self, other, start=0):
+        """
+        Copy all pixels of other (same type of buffer) into this buffer from pixel start onwards
+        """
+        start, end = self._clamp(start, start + other.n)
+        self.mark_dirty(start, end)
+        self._copy_from(other.buf, start, end)
+
+    @micropython.native
+    def max_from(self, other, start=0):
+        """
+        Per channel maximum of other (same type of buffer) and this buffer from pixel start onwards
+        """
+        start, end = self._clamp(start, start + other.n)
+        self.mark_dirty(start, end)
+        self._max_from(other.buf, start, end)
+
+    @micropython.native
+    def blend_from(self, other, opacity=255, mask=None, start=0):
+        """
+        Alpha blend other (same type of buffer) over this buffer from pixel start onwards
+        :param opacity: 0 (transparent) - 255 (opaque)
+        :param mask: (None) bytearray with an extra 0-255 opacity per pixel of other
+        """
+        start, end = self._clamp(start, start + other.n)
+        self.mark_dirty(start, end)
+        self._blend_opacity = opacity
+        self._blend_mask = mask
+        self._blend_from(other.buf, start, end)
+
+    @micropython.native
+    def rotate(self, k, start=0, end=None):
+        """
+        Rotate pixels k positions towards the end (k < 0 towards the start)
+        """
+        start, end = self._clamp(start, end)
+        n = end - start
+        if n <= 1:
+            return
+        self.mark_dirty(start, end)
+        k %= n
+        if k:
+            self._reverse(start, end)
+            self._reverse(start, start + k)
+            self._reverse(start + k, end)
+
+    @micropython.native
+    def shift(self, k, start=0, end=None):
+        """
+        Shift pixels k positions towards the end (k < 0 towards the start), vacated pixels are cleared
+        """
+        start, end = self._clamp(start, end)
+        self.mark_dirty(start, end)
+        if k >= end - start or -k >= end - start:
+            self._fill_range(start, end, 0)
+        elif k > 0:
+            self._shift_up(start, end, k)
+            self._fill_range(start, start + k, 0)
+        elif k < 0:
+            self._shift_down(start, end, -k)
+            self._fill_range(end + k, end, 0)
+
+    def _fill_range(self, start, end, packed):
+        buf = self.buf
+        for i in range(start, end):
+            buf[i] = packed
+
+    def _fade_range(self, start, end, multiplier):
+        buf = self.buf
+        for i in range(start, end):
+            buf[i] = (buf[i] * multiplier + 255) >> 8
+
+    def _add_from(self, src, start, end):
+        buf = self.buf
+        max_value = self.max_pixel_value
+        for i in range(start, end):
+            buf[i] = min(max_value, buf[i] + src[i - start])
+
+    def _copy_from(self, src, start, end):
+        buf = self.buf
+        for i in range(start, end):
+            buf[i] = src[i - start]
+
+    def _max_from(self, src, start, end):
+        buf = self.buf
+        for i in range(start, end):
+            buf[i] = max(buf[i], src[i - start])
+
+    def _blend_from(self, src, start, end):
+        buf = self.buf
+        opacity = self._blend_opacity
+        opacity += opacity >> 7  # 0 - 256
+        mask = self._blend_mask
+        for i in range(start, end):
+            a = opacity if mask is None else (mask[i - start] * opacity + 255) >> 8
+            buf[i] += ((src[i - start] - buf[i]) * a) >> 8
+
+    def _reverse(self, start, end):
+        buf = self.buf
+        end -= 1
+        while start < end:
+            buf[start], buf[end] = buf[end], buf[start]
+            start += 1
+            end -= 1
+
+    def _shift_up(self, start, end, k):
+        buf = self.buf
+        i = end - 1
+        while i >= start + k:
+            buf[i] = buf[i - k]
+            i -= 1
+
+    def _shift_down(self, start, end, k):
+        buf = self.buf
+        i = start
+        while i < end - k:
+            buf[i] = buf[i + k]
+            i += 1
 
 
 class PixelBufferBit(PixelBuffer):
@@ -92,6 +336,98 @@ class PixelBufferPWM(PixelBuffer):
     def __init__(self, n):
         super().__init__(n, 65535, 'H')
 
+    @micropython.viper
+    def _fill_range(self, start: int, end: int, packed: int):
+        buf = ptr16(self.buf)
+        while start < end:
+            buf[start] = packed
+            start += 1
+
+    @micropython.viper
+    def _fade_range(self, start: int, end: int, multiplier: int):
+        buf = ptr16(self.buf)
+        while start < end:
+            buf[start] = (buf[start] * multiplier + 255) >> 8
+            start += 1
+
+    @micropython.viper
+    def _add_from(self, src, start: int, end: int):
+        buf = ptr16(self.buf)
+        s = ptr16(src)
+        j = 0
+        while start < end:
+            new = buf[start] + s[j]
+            buf[start] = new if new < 65535 else 65535
+            start += 1
+            j += 1
+
+    @micropython.viper
+    def _copy_from(self, src, start: int, end: int):
+        buf = ptr16(self.buf)
+        s = ptr16(src)
+        j = 0
+        while start < end:
+            buf[start] = s[j]
+            start += 1
+            j += 1
+
+    @micropython.viper
+    def _max_from(self, src, start: int, end: int):
+        buf = ptr16(self.buf)
+        s = ptr16(src)
+        j = 0
+        while start < end:
+            if s[j] > buf[start]:
+                buf[start] = s[j]
+            start += 1
+            j += 1
+
+    @micropython.viper
+    def _blend_from(self, src, start: int, end: int):
+        buf = ptr16(self.buf)
+        s = ptr16(src)
+        opacity = int(self._blend_opacity)
+        opacity += opacity >> 7  # 0 - 256
+        mask = self._blend_mask
+        m = ptr8(mask if mask is not None else self.buf)
+        use_mask = mask is not None
+        a = opacity
+        j = 0
+        while start < end:
+            if use_mask:
+                a = (m[j] * opacity + 255) >> 8
+            d = int(buf[start])
+            buf[start] = d + (((int(s[j]) - d) * a) >> 8)
+            start += 1
+            j += 1
+
+    @micropython.viper
+    def _reverse(self, start: int, end: int):
+        buf = ptr16(self.buf)
+        end -= 1
+        while start < end:
+            tmp = buf[start]
+            buf[start] = buf[end]
+            buf[end] = tmp
+            start += 1
+            end -= 1
+
+    @micropython.viper
+    def _shift_up(self, start: int, end: int, k: int):
+        buf = ptr16(self.buf)
+        i = end - 1
+        while i >= start + k:
+            buf[i] = buf[i - k]
+            i -= 1
+
+    @micropython.viper
+    def _shift_down(self, start: int, end: int, k: int):
+        buf = ptr16(self.buf)
+        i = start
+        while i < end - k:
+            buf[i] = buf[i + k]
+            i += 1
+
 
 class PixelBufferNeo(PixelBuffer):
 
@@ -104,9 +440,83 @@ class PixelBufferNeo(PixelBuffer):
         super().__init__(n, max_value, 'I')
         self.tmp_buf = array.array('B', [0, 0, 0, 0])
         self.bpp = bpp
+        self.brightness = 255
+        self.gamma = 1.0
+        self.white_balance = None
+        self.lut = None  # 4 x 256 entries, one table per byte of a pixel word (W B R G)
+        self.out_buf = None  # corrected copy of buf that is sent to the leds
+
+    def set_correction(self, brightness=255, gamma=1.0, white_balance=None):
+        """
+        Brightness, gamma and white balance are applied when the buffer is sent to the leds, the buffer itself
+        keeps the full resolution values set by the patterns.
+        :param brightness: 0-255
+        :param gamma: 1.0 is linear, 2.2-2.8 is typical for leds
+        :param white_balance: max value per channel [r, g, b] or [r, g, b, w] (None is no correction)
+        """
+        self.brightness = brightness
+        self.gamma = gamma
+        self.white_balance = white_balance
+        if brightness == 255 and gamma == 1.0 and white_balance is None:
+            self.lut = None
+            self.mark_dirty(0, self.n)
+            return
+
+        # byte order within a pixel word: 0:W 1:B 2:R 3:G
+        channel_max = [255, 255, 255, 255]
+        if white_balance is not None:
+            for byte, channel in enumerate((3, 2, 0, 1)):
+                if channel < len(white_balance):
+                    channel_max[byte] = white_balance[channel]
+
+        lut = self.lut if self.lut is not None else bytearray(1024)
+        for byte in range(4):
+            scale = channel_max[byte] * brightness / 255
+            o = byte << 8
+            for v in range(256):
+                lut[o + v] = int(scale * (v / 255) ** gamma + .5)
+        if self.out_buf is None:
+            self.out_buf = array.array('I', bytearray(self.n << 2))
+        self.lut = lut
+        self.mark_dirty(0, self.n)  # all pixels have to be sent with the new correction
+
+    def set_brightness(self, brightness):
+        self.set_correction(brightness, self.gamma, self.white_balance)
+
+    @micropython.native
+    def output(self, out=None):
+        """
+        :param out: (None) array to write the corrected pixels to, by default the internal out_buf is used
+        :return: array with the pixel words to send to the leds
+        """
+        lut = self.lut
+        if lut is None:
+            if out is None:
+                return self.buf
+            out[:] = self.buf
+            return out
+        if out is None:
+            out = self.out_buf
+        self._apply_lut(out, lut)
+        return out
+
+    @micropython.viper
+    def _apply_lut(self, out, lut):
+        src = ptr8(self.buf)
+        dst = ptr8(out)
+        table = ptr8(lut)
+        n = int(self.n) << 2
+        i = 0
+        while i < n:
+            dst[i] = table[((i & 3) << 8) + src[i]]
+            i += 1
 
     @micropython.viper
     def in_convert(self, value):
+        if isinstance(value, int):  # already packed
+            tmp32 = ptr32(self.tmp_buf)
+            tmp32[0] = uint(value)
+            return
         bpp = int(self.bpp)
         tmp = ptr8(self.tmp_buf)
         tmp[3] = uint(value[1])
@@ -129,16 +539,43 @@ class PixelBufferNeo(PixelBuffer):
     def fade_pixel_value(self, value, fade):
         """
         Fades a pixel value
-        :param value: original pixel value (list)
+        :param value: original pixel value (list or packed int)
         :param fade: value between 0 and 1
         :return: new faded pixel value
         """
+        if isinstance(value, int):
+            return self.fade_packed(value, int(fade * 255))
         return [min(255, int(v * fade)) for v in value]
 
     @micropython.native
     def merge_pixel_value(self, value1, value2):
+        if isinstance(value1, int) and isinstance(value2, int):
+            return self.merge_packed(value1, value2)
         return [min(255, v1 + v2) for v1, v2 in zip(value1, value2)]
 
+    @micropython.viper
+    def fade_packed(self, word: uint, multiplier: int) -> uint:
+        """
+        :param multiplier: 0 (black) - 255 (unchanged), same rounding as fade_range
+        """
+        result = uint(0)
+        shift = 0
+        while shift < 32:
+            c = (int((word >> shift) & 0xff) * multiplier + 255) >> 8
+            result |= uint(c) << shift
+            shift += 8
+        return result
+
+    @micropython.viper
+    def merge_packed(self, word1: uint, word2: uint) -> uint:
+        result = uint(0)
+        shift = 0
+        while shift < 32:
+            c = int((word1 >> shift) & 0xff) + int((word2 >> shift) & 0xff)
+            result |= uint(c if c < 255 else 255) << shift
+            shift += 8
+        return result
+
     def __len__(self):
         return self.n
 
@@ -153,19 +590,56 @@ class PixelBufferNeo(PixelBuffer):
             tmp = ptr32(self.tmp_buf)
 
             i = int(idx)
+            if i < 0:
+                i += int(self.n)
             buf[i] = tmp[0]
+            if i < int(self.dirty_start):
+                self.dirty_start = i
+            if i >= int(self.dirty_end):
+                self.dirty_end = i + 1
 
-    @micropython.viper
+    @micropython.native
     def __getitem__(self, i: int):
-        n = int(self.n)
+        """
+        :return: new [r, g, b(, w)] list, use get_packed or read_into to avoid the allocation
+        """
+        self.read_into(i, self.tmp_buf)
+        tmp = self.tmp_buf
+        if self.bpp == 3:
+            return [tmp[0], tmp[1], tmp[2]]
+        return [tmp[0], tmp[1], tmp[2], tmp[3]]
 
+    @micropython.native
+    def read_into(self, i: int, out):
+        """
+        Copy pixel i as r, g, b, w into out (4 byte array)
+        """
+        n = self.n
         if i >= n:
-            i = i - 1
+            i = n - 1
+        elif i < 0:
+            i += n
         self.out_convert(i)
-        return self.tmp_buf
+        if out is not self.tmp_buf:
+            tmp = self.tmp_buf
+            out[0] = tmp[0]
+            out[1] = tmp[1]
+            out[2] = tmp[2]
+            out[3] = tmp[3]
+        return out
+
+    @micropython.viper
+    def get_packed(self, i: int) -> uint:
+        buf = ptr32(self.buf)
+        n = int(self.n)
+        if i >= n:
+            i = n - 1
+        return buf[i]
 
     @micropython.native
     def fill(self, v, slc: slice = FULL_SLICE):
+        i, n, _ = slc.indices(self.n)
+        self.mark_dirty(i, n)
         self._fill(v, slc)
 
     @micropython.viper
@@ -208,6 +682,120 @@ class PixelBufferNeo(PixelBuffer):
             new = buf[o + j] + tmp[j]
             buf[o + j] = new if new < 255 else 255
             j += 1
+        if i < int(self.dirty_start):
+            self.dirty_start = i
+        if i >= int(self.dirty_end):
+            self.dirty_end = i + 1
+
+    @micropython.native
+    def pack(self, value):
+        self.in_convert(value)
+        return self._tmp_word()
+
+    @micropython.viper
+    def _tmp_word(self) -> uint:
+        tmp = ptr32(self.tmp_buf)
+        return tmp[0]
+
+    @micropython.viper
+    def _fill_range(self, start: int, end: int, packed: uint):
+        buf = ptr32(self.buf)
+        while start < end:
+            buf[start] = packed
+            start += 1
+
+    @micropython.viper
+    def _fade_range(self, start: int, end: int, multiplier: int):
+        buf = ptr8(self.buf)
+        i = start << 2
+        end <<= 2
+        while i < end:
+            buf[i] = (buf[i] * multiplier + 255) >> 8
+            i += 1
+
+    @micropython.viper
+    def _add_from(self, src, start: int, end: int):
+        buf = ptr8(self.buf)
+        s = ptr8(src)
+        i = start << 2
+        end <<= 2
+        j = 0
+        while i < end:
+            new = buf[i] + s[j]
+            buf[i] = new if new < 255 else 255
+            i += 1
+            j += 1
+
+    @micropython.viper
+    def _copy_from(self, src, start: int, end: int):
+        buf = ptr32(self.buf)
+        s = ptr32(src)
+        j = 0
+        while start < end:
+            buf[start] = s[j]
+            start += 1
+            j += 1
+
+    @micropython.viper
+    def _max_from(self, src, start: int, end: int):
+        buf = ptr8(self.buf)
+        s = ptr8(src)
+        i = start << 2
+        end <<= 2
+        j = 0
+        while i < end:
+            if s[j] > buf[i]:
+                buf[i] = s[j]
+            i += 1
+            j += 1
+
+    @micropython.viper
+    def _blend_from(self, src, start: int, end: int):
+        buf = ptr8(self.buf)
+        s = ptr8(src)
+        opacity = int(self._blend_opacity)
+        opacity += opacity >> 7  # 0 - 256
+        mask = self._blend_mask
+        m = ptr8(mask if mask is not None else self.buf)
+        use_mask = mask is not None
+        a = opacity
+        i = start << 2
+        end <<= 2
+        j = 0
+        while i < end:
+            if use_mask and (j & 3) == 0:
+                a = (m[j >> 2] * opacity + 255) >> 8
+            d = int(buf[i])
+            buf[i] = d + (((int(s[j]) - d) * a) >> 8)
+            i += 1
+            j += 1
+
+    @micropython.viper
+    def _reverse(self, start: int, end: int):
+        buf = ptr32(self.buf)
+        end -= 1
+        while start < end:
+            tmp = buf[start]
+            buf[start] = buf[end]
+            buf[end] = tmp
+            start += 1
+            end -= 1
+
+    @micropython.viper
+    def _shift_up(self, start: int, end: int, k: int):
+        buf = ptr32(self.buf)
+        i = end - 1
+        while i >= start + k:
+            buf[i] = buf[i - k]
+            i -= 1
+
+    @micropython.viper
+    def _shift_down(self, start: int, end: int, k: int):
+        buf = ptr32(self.buf)
+        i = start
+        while i < end - k:
+            buf[i] = buf[i + k]
+            i += 1
 
 
 class PixelBufferSegment(PixelBuffer):
@@ -222,6 +810,7 @@ class PixelBufferSegment(PixelBuffer):
         self.end = max(0, min(end, self.buf.n))
         self.n = 1 + self.end - self.start
         self.max_value = pixel_buffer.max_pixel_value
+        self._full_slice = make_slice[self.start:self.start + self.n]
 
     @micropython.native
     def fade_pixel_value(self, value, fade):
@@ -233,6 +822,8 @@ class PixelBufferSegment(PixelBuffer):
 
     @micropython.native
     def _reslice(self, slc):
+        if slc is FULL_SLICE:
+            return self._full_slice
         start, end, step = slc.indices(self.n)
         self_start = self.start
         return make_slice[start + self_start:end + self_start: step]
@@ -241,6 +832,71 @@ class PixelBufferSegment(PixelBuffer):
     def pixel_merge(self, i: int, v):
         return self.buf.pixel_merge(i + self.start, v)
 
+    @micropython.native
+    def pack(self, value):
+        return self.buf.pack(value)
+
+    def set_correction(self, brightness=255, gamma=1.0, white_balance=None):
+        return self.buf.set_correction(brightness, gamma, white_balance)
+
+    def set_brightness(self, brightness):
+        return self.buf.set_brightness(brightness)
+
+    @micropython.native
+    def fill_range(self, start, end, packed):
+        start, end = self._clamp(start, end)
+        self.buf.fill_range(start + self.start, end + self.start, packed)
+
+    @micropython.native
+    def fade_range(self, start, end, multiplier: int):
+        start, end = self._clamp(start, end)
+        self.buf.fade_range(start + self.start, end + self.start, multiplier)
+
+    @micropython.native
+    def add_from(self, other, start=0):
+        start, end = self._clamp(start, start + other.n)
+        self.buf.mark_dirty(start + self.start, end + self.start)
+        self.buf._add_from(other.buf, start + self.start, end + self.start)
+
+    @micropython.native
+    def copy_from(self, other, start=0):
+        start, end = self._clamp(start, start + other.n)
+        self.buf.mark_dirty(start + self.start, end + self.start)
+        self.buf._copy_from(other.buf, start + self.start, end + self.start)
+
+    @micropython.native
+    def max_from(self, other, start=0):
+        start, end = self._clamp(start, start + other.n)
+        self.buf.mark_dirty(start + self.start, end + self.start)
+        self.buf._max_from(other.buf, start + self.start, end + self.start)
+
+    @micropython.native
+    def blend_from(self, other, opacity=255, mask=None, start=0):
+        start, end = self._clamp(start, start + other.n)
+        buf = self.buf
+        buf.mark_dirty(start + self.start, end + self.start)
+        buf._blend_opacity = opacity
+        buf._blend_mask = mask
+        buf._blend_from(other.buf, start + self.start, end + self.start)
+
+    @micropython.native
+    def mark_dirty(self, start, end):
+        self.buf.mark_dirty(start + self.start, end + self.start)
+
+    @property
+    def dirty(self):
+        return self.buf.dirty
+
+    @micropython.native
+    def rotate(self, k, start=0, end=None):
+        start, end = self._clamp(start, end)
+        self.buf.rotate(k, start + self.start, end + self.start)
+
+    @micropython.native
+    def shift(self, k, start=0, end=None):
+        start, end = self._clamp(start, end)
+        self.buf.shift(k, start + self.start, end + self.start)
+
     @micropython.native
     def fade(self, factor: float, slc: slice = FULL_SLICE):
         return self.buf.fade(factor, self._reslice(slc))
@@ -264,3 +920,104 @@ class PixelBufferSegment(PixelBuffer):
         else:
             i += self.start
         return self.buf.__setitem__(i, v)
+
+
+class BitPlanes:
+    """
+    Bit plane transposed copy of up to 8 PixelBufferNeo buffers, for sending all strips in parallel from one
+    state machine (see pio_state_machines.ws2812_parallel). Each output byte holds the same bit of the same
+    pixel of every strip, strip i in bit i.
+    """
+
+    def __init__(self, pixel_buffers):
+        if not 0 < len(pixel_buffers) <= 8:
+            raise Exception('BitPlanes supports 1 to 8 pixel buffers, not %i' % len(pixel_buffers))
+        bpp = pixel_buffers[0].bpp
+        for pixel_buffer in pixel_buffers:
+            if pixel_buffer.bpp != bpp:
+                raise Exception('all pixel buffers must have the same bpp')
+        self.pixel_buffers = pixel_buffers
+        self.bits = bpp * 8
+        self.n = max([pixel_buffer.n for pixel_buffer in pixel_buffers])
+        self.buf = array.array('I', bytearray(self.n * self.bits))  # n * bits bytes, sent as words
+
+    @micropython.native
+    def transpose(self):
+        """
+        :return: the transposed buffer, corrected (brightness, gamma) pixel values are used
+        """
+        self._clear()
+        lane = 0
+        for pixel_buffer in self.pixel_buffers:
+            self._transpose(pixel_buffer.output(), lane, pixel_buffer.n)
+            lane += 1
+        return self.buf
+
+    @micropython.viper
+    def _clear(self):
+        buf = ptr32(self.buf)
+        n = int(len(self.buf))
+        i = 0
+        while i < n:
+            buf[i] = 0
+            i += 1
+
+    @micropython.viper
+    def _transpose(self, src, lane: int, n: int):
+        words = ptr32(src)
+        out = ptr8(self.buf)
+        bits = int(self.bits)
+        end = 31 - bits
+        mask = 1 << lane
+        o = 0
+        p = 0
+        while p < n:
+            word = uint(words[p])
+            b = 31
+            while b > end:
+                if (word >> b) & 1:
+                    out[o] |= mask
+                o += 1
+                b -= 1
+            p += 1
+
+
+class APA102Frame:
+    """
+    SPI byte stream for APA102 / SK9822 leds, encoded from PixelBufferNeo words. A frame is 4 zero bytes,
+    per led 0xe0 | 5 bit global brightness, blue, green, red, and an end frame: 4 zero bytes (SK9822 latch)
+    plus half a clock per led (APA102 shifts the data on with a delay of half a clock per led).
+    """
+
+    def __init__(self, n, bpp=3, brightness=31):
+        """
+        :param bpp: 3: r, g, b with the same brightness for all leds. 4: r, g, b, brightness per led (0-255)
+        :param brightness: 0-31 global brightness field for bpp 3
+        """
+        self.n = n
+        self.bpp = bpp
+        self.brightness = brightness
+        self.buf = bytearray(4 + (n << 2) + 4 + (n + 15) // 16)  # start and end frames stay zero
+
+    @micropython.viper
+    def encode(self, words):
+        """
+        :param words: packed pixel words (eg PixelBufferNeo.output())
+        """
+        src = ptr8(words)
+        dst = ptr8(self.buf)
+        n = int(self.n) << 2
+        per_led = int(self.bpp) == 4
+        level = 0xe0 | (int(self.brightness) & 0x1f)
+        i = 0
+        o = 4
+        while i < n:  # pixel word bytes: W B R G
+            if per_led:
+                level = 0xe0 | (src[i] >> 3)
+            dst[o] = level
+            dst[o + 1] = src[i + 1]
+            dst[o + 2] = src[i + 3]
+            dst[o + 3] = src[i + 2]
+            i += 4
+            o += 4
+        return self.buf
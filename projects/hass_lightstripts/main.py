@@ -159,6 +159,14 @@ add_task(ledstrip_driver, upper['pin'], hass_lightstrip, name='Lightstrip Door',
 add_task(ledstrip_driver, lower['pin'], hass_lightstrip, name='Lightstrip Stairs', mqtt=hass_mqtt,
          patterns=strip2_patterns, n=lower['length'], bpp=lower['bpp'], state_machine=1)
 
+# both strips from one task, their frames start at the same time
+# add_task(neo_driver_multi, [
+#     (upper['pin'], hass_lightstrip, upper['length'], upper['bpp'],
+#      {'name': 'Lightstrip Door', 'mqtt': hass_mqtt, 'patterns': strip1_patterns}),
+#     (lower['pin'], hass_lightstrip, lower['length'], lower['bpp'],
+#      {'name': 'Lightstrip Stairs', 'mqtt': hass_mqtt, 'patterns': strip2_patterns}),
+# ], state_machine=0)
+
 # s1_pattern = 'party'
 # add_task(ledstrip_driver, upper['pin'], strip1_patterns[s1_pattern][0], n=upper['length'], bpp=upper['bpp'], **strip1_patterns[s1_pattern][1], state_machine=0)
 
@@ -0,0 +1,59 @@
+# Coroutine switches per second with and without use_scheduler(), on the host.
+# N tasks yield a 60 Hz frame delay for 10 simulated seconds. Without the scheduler every task is a
+# coroutine that uasyncio resumes for every step, with the scheduler one coroutine steps all tasks that are due.
+# The host time per step shows the python overhead of both paths.
+#
+#   python tests/bench_scheduler.py
+
+import time
+
+import host_env
+
+import uasyncio
+
+import async_runner
+
+SIMULATED_MS = 10_000
+FREQ = 60
+
+
+def frame(freq=FREQ):
+    delay_ms = 1000 // freq
+    while True:
+        yield delay_ms
+
+
+async def run_for(ms):
+    await uasyncio.sleep_ms(ms)
+
+
+def run(nr_tasks, scheduler):
+    uasyncio.core.reset()
+    host_env.clock.us = 0
+    async_runner.tasks.clear()
+    async_runner._scheduler = None
+    if scheduler:
+        async_runner.use_scheduler()
+    for _ in range(nr_tasks):
+        async_runner.add_task(frame, gc_collect=False)
+
+    start = time.perf_counter()
+    uasyncio.run(run_for(SIMULATED_MS))
+    host_s = time.perf_counter() - start
+
+    for task in list(async_runner.tasks):
+        task.cancel()
+    steps = nr_tasks * SIMULATED_MS * FREQ // 1000
+    return uasyncio.core.switches * 1000 // SIMULATED_MS, host_s * 1e6 / steps
+
+
+def main():
+    print('tasks   switches/s per task   switches/s scheduler   host us/step per task   host us/step scheduler')
+    for nr_tasks in (10, 50, 200):
+        per_task, per_task_us = run(nr_tasks, False)
+        scheduled, scheduled_us = run(nr_tasks, True)
+        print('%5d   %19d   %20d   %21.1f   %22.1f' % (nr_tasks, per_task, scheduled, per_task_us, scheduled_us))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+import pytest
+
+import host_env
+
+
+@pytest.fixture
+def clock():
+    """
+    Simulated clock, restarted for every test together with an empty uasyncio event loop
+    """
+    import uasyncio
+    uasyncio.core.reset()
+    host_env.clock.us = 0
+    return host_env.clock
+
+
+@pytest.fixture
+def runner(clock):
+    """
+    async_runner without tasks or scheduler, gc is left alone
+    """
+    import async_runner
+    async_runner.tasks.clear()
+    async_runner._scheduler = None
+    async_runner.instrument_tasks = False
+    async_runner.set_gc_policy(async_runner.GCIdle())
+    yield async_runner
+    for task in list(async_runner.tasks):
+        task.cancel()
+    async_runner._scheduler = None
+
+
+def run_for(ms):
+    """
+    Run the event loop for ms of simulated time
+    """
+    import uasyncio
+
+    async def main():
+        await uasyncio.sleep_ms(ms)
+
+    uasyncio.run(main())
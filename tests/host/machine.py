@@ -0,0 +1,88 @@
+# Host stand-in for the machine module. idle() and lightsleep() move the simulated clock of host_env.
+
+import host_env
+
+_freq = 125_000_000
+lightsleeps = 0
+
+
+def idle():
+    host_env.clock.advance_us(1000)
+
+
+def lightsleep(ms):
+    global lightsleeps
+    lightsleeps += 1
+    host_env.clock.advance_ms(ms)
+
+
+def freq(hz=None):
+    global _freq
+    if hz is None:
+        return _freq
+    _freq = hz
+
+
+def unique_id():
+    return b'\x00\x01\x02\x03\x04\x05\x06\x07'
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_FALLING = 4
+    IRQ_RISING = 8
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.id = id
+        self._value = value or 0
+
+    def value(self, v=None):
+        if v is None:
+            return self._value
+        self._value = v
+
+    def on(self):
+        self._value = 1
+
+    def off(self):
+        self._value = 0
+
+    def irq(self, handler=None, trigger=0):
+        pass
+
+
+class PWM:
+    def __init__(self, pin):
+        self.pin = pin
+        self._freq = 0
+        self._duty = 0
+
+    def freq(self, f=None):
+        if f is None:
+            return self._freq
+        self._freq = f
+
+    def duty_u16(self, d=None):
+        if d is None:
+            return self._duty
+        self._duty = d
+
+    def deinit(self):
+        pass
+
+
+class Timer:
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, id=-1, **kwargs):
+        pass
+
+    def init(self, **kwargs):
+        pass
+
+    def deinit(self):
+        pass
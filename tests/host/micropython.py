@@ -0,0 +1,21 @@
+# Host stand-in for the micropython module: the code emitters are left out, so native and viper
+# functions run as plain python (viper pointers are provided as builtins by host_env)
+
+
+def native(f):
+    return f
+
+
+viper = native
+
+
+def const(x):
+    return x
+
+
+def alloc_emergency_exception_buf(size):
+    pass
+
+
+def schedule(fcn, arg):
+    fcn(arg)
@@ -0,0 +1,15 @@
+# Host stand-in for the network module, only needed to import the mqtt client
+
+STA_IF = 0
+AP_IF = 1
+
+
+class WLAN:
+    def __init__(self, interface=STA_IF):
+        self.interface = interface
+
+    def active(self, is_active=None):
+        return False
+
+    def isconnected(self):
+        return False
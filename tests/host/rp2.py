@@ -0,0 +1,24 @@
+# Host stand-in for the rp2 module, only what is touched at import time or by cleanup()
+
+
+class PIO:
+    def __init__(self, id):
+        self.id = id
+
+    def remove_program(self, program=None):
+        pass
+
+
+class StateMachine:
+    def __init__(self, id, *args, **kwargs):
+        self.id = id
+
+    def active(self, value=None):
+        return False
+
+
+def asm_pio(**kwargs):
+    def decorator(fcn):
+        return fcn
+
+    return decorator
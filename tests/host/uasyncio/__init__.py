@@ -0,0 +1,80 @@
+# Host stand-in for uasyncio, see core.py
+
+import time
+
+from . import core
+from .core import CancelledError, TimeoutError, Task, create_task, sleep, sleep_ms
+
+coroutine_waits = 0  # Event.wait() and ThreadSafeFlag.wait() coroutines created
+
+
+class Event:
+    def __init__(self):
+        self.state = False
+        self.waiting = core.TaskQueue()
+
+    def is_set(self):
+        return self.state
+
+    def set(self):
+        while self.waiting.peek():
+            core._task_queue.push(self.waiting.pop())
+        self.state = True
+
+    def clear(self):
+        self.state = False
+
+    async def wait(self):
+        global coroutine_waits
+        coroutine_waits += 1
+        if not self.state:
+            self.waiting.push(core.cur_task)
+            core.cur_task.data = self.waiting
+            await core._Yield()
+        return True
+
+
+class ThreadSafeFlag:
+    def __init__(self):
+        self.state = 0
+
+    def set(self):
+        self.state = 1
+
+    def clear(self):
+        self.state = 0
+
+    async def wait(self):
+        global coroutine_waits
+        coroutine_waits += 1
+        if not self.state:
+            core._io_queue.queue_read(self)
+            await core._Yield()
+        self.state = 0
+
+
+async def wait_for_ms(aw, timeout):
+    task = create_task(aw)
+    end = time.ticks_add(time.ticks_ms(), timeout)
+    while not task.done():
+        if time.ticks_diff(end, time.ticks_ms()) <= 0:
+            task.cancel()
+            raise TimeoutError
+        await sleep_ms(1)
+    return task.result
+
+
+def run(coro):
+    return core.run_until_complete(create_task(coro))
+
+
+class Loop:
+    def run_forever(self):
+        core.run_until_complete()
+
+    def run_until_complete(self, aw):
+        return core.run_until_complete(create_task(aw))
+
+
+def get_event_loop():
+    return Loop()
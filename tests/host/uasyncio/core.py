@@ -0,0 +1,209 @@
+# Host stand-in for uasyncio.core, follows the structure of the micropython implementation (tasks are parked on
+# TaskQueues and task.data links a task to the queue it waits on) so code that uses these internals can be tested.
+# Time is the simulated clock of host_env: when nothing is runnable the loop jumps to the next deadline.
+
+import heapq
+import time
+
+
+class CancelledError(BaseException):
+    pass
+
+
+class TimeoutError(Exception):
+    pass
+
+
+class TaskQueue:
+    """
+    Same interface as the pairing heap of uasyncio >= 1.20: push(), pop(), peek() and remove()
+    """
+
+    def __init__(self):
+        self.heap = []
+        self._seq = 0
+
+    def peek(self):
+        return self.heap[0][2] if self.heap else None
+
+    def push(self, v, key=None):
+        v.data = None
+        v.ph_key = key if key is not None else time.ticks_ms()
+        self._seq += 1
+        heapq.heappush(self.heap, (v.ph_key, self._seq, v))
+
+    def pop(self):
+        return heapq.heappop(self.heap)[2]
+
+    def remove(self, v):
+        for i, entry in enumerate(self.heap):
+            if entry[2] is v:
+                self.heap.pop(i)
+                heapq.heapify(self.heap)
+                return
+
+
+class Task:
+    def __init__(self, coro):
+        self.coro = coro
+        self.data = None  # queue the task waits on, or the exception to throw into it
+        self.ph_key = 0
+        self.state = True  # True: running, TaskQueue: tasks awaiting this one, None: done
+        self.result = None
+
+    def done(self):
+        return self.state is None
+
+    def cancel(self):
+        if self is cur_task:
+            raise RuntimeError("can't cancel self")
+        if self.done():
+            return False
+        if hasattr(self.data, 'remove'):  # waiting on an event or I/O, take it off that queue
+            self.data.remove(self)
+        else:
+            _task_queue.remove(self)
+        _task_queue.push(self)
+        self.data = CancelledError
+        return True
+
+    def __await__(self):
+        if not self.done():
+            if self.state is True:
+                self.state = TaskQueue()
+            self.state.push(cur_task)
+            cur_task.data = self.state
+            yield
+        if isinstance(self.result, BaseException):
+            raise self.result
+        return self.result
+
+
+class IOQueue:
+    """
+    Only ThreadSafeFlag style streams (a state attribute) are polled
+    """
+
+    def __init__(self):
+        self.map = {}
+
+    def queue_read(self, s):
+        self.map[id(s)] = [cur_task, None, s]
+        cur_task.data = self
+
+    def remove(self, task):
+        for key, entry in list(self.map.items()):
+            if entry[0] is task:
+                del self.map[key]
+
+    def wait_io_event(self, dt):
+        for key, entry in list(self.map.items()):
+            if entry[2].state:
+                del self.map[key]
+                _task_queue.push(entry[0])
+                return
+        if dt > 0:  # nothing happens until the next deadline
+            time.sleep_ms(dt)
+        elif dt < 0:
+            raise Exception('event loop deadlocked: only tasks waiting on I/O that is never set')
+
+
+class _Yield:
+    def __await__(self):
+        yield
+
+
+class _Sleep:
+    def __init__(self):
+        self.state = None
+
+    def __iter__(self):
+        return self
+
+    __await__ = __iter__
+
+    def __next__(self):
+        if self.state is not None:
+            _task_queue.push(cur_task, self.state)
+            self.state = None
+            return None
+        raise StopIteration
+
+
+_sleep = _Sleep()
+
+
+def sleep_ms(t):
+    _sleep.state = time.ticks_add(time.ticks_ms(), max(0, t))
+    return _sleep
+
+
+def sleep(t):
+    return sleep_ms(int(t * 1000))
+
+
+def create_task(coro):
+    task = Task(coro)
+    _task_queue.push(task)
+    return task
+
+
+def run_until_complete(main_task=None):
+    global cur_task, switches
+    while True:
+        dt = 1
+        while dt > 0:
+            t = _task_queue.peek()
+            if t is not None:
+                dt = max(0, time.ticks_diff(t.ph_key, time.ticks_ms()))
+            elif not _io_queue.map:
+                cur_task = None
+                return
+            else:
+                dt = -1
+            _io_queue.wait_io_event(dt)
+            if dt < 0:
+                dt = 0
+        t = _task_queue.pop()
+        cur_task = t
+        switches += 1
+        time.sleep_us(SWITCH_US)
+        try:
+            exc = t.data
+            if not exc:
+                t.coro.send(None)
+            else:
+                t.data = None
+                t.coro.throw(exc)
+        except (CancelledError, StopIteration, Exception) as er:
+            waiting = t.state
+            t.state = None
+            t.result = er.value if isinstance(er, StopIteration) else er
+            if isinstance(waiting, TaskQueue):
+                while waiting.peek():
+                    _task_queue.push(waiting.pop())
+            elif not isinstance(er, (CancelledError, StopIteration)):
+                raise  # unhandled exception of a task, fail the test instead of printing it
+            if t is main_task:
+                cur_task = None
+                if isinstance(er, StopIteration):
+                    return er.value
+                raise er
+
+
+def reset():
+    """
+    Start from an empty event loop (between tests)
+    """
+    global cur_task, _task_queue, _io_queue, switches
+    cur_task = None
+    switches = 0
+    _task_queue = TaskQueue()
+    _io_queue = IOQueue()
+
+
+cur_task = None
+_task_queue = TaskQueue()
+_io_queue = IOQueue()
+switches = 0  # coroutines resumed by the loop
+SWITCH_US = 10  # simulated cost of resuming a coroutine, so a loop that keeps rescheduling itself still moves time
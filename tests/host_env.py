@@ -0,0 +1,77 @@
+# Host environment to run the library under CPython: the stand-in micropython, machine, rp2 and uasyncio modules
+# of tests/host are put on the path, viper pointer types become builtins and the time.ticks_* functions run on a
+# simulated clock. Time only moves when code sleeps or a test advances it, so task costs can be simulated exactly.
+
+import builtins
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+class SimClock:
+    def __init__(self):
+        self.us = 0
+
+    def advance_us(self, us):
+        self.us += us
+
+    def advance_ms(self, ms):
+        self.us += ms * 1000
+
+    def ticks_ms(self):
+        return self.us // 1000
+
+    def ticks_us(self):
+        return self.us
+
+
+clock = SimClock()
+
+
+def _ptr8(buf):
+    return memoryview(buf).cast('B')
+
+
+def _ptr16(buf):
+    return memoryview(buf).cast('B').cast('H')
+
+
+def _ptr32(buf):
+    if isinstance(buf, memoryview):
+        return buf.cast('B').cast('I')
+    return buf
+
+
+def install():
+    for path in (os.path.join(HERE, 'host'), os.path.dirname(HERE)):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+    for name in ('binascii', 'collections', 'errno', 'socket', 'struct', 'time'):
+        sys.modules.setdefault('u' + name, __import__(name))
+
+    import micropython
+    builtins.micropython = micropython
+    builtins.ptr8 = _ptr8
+    builtins.ptr16 = _ptr16
+    builtins.ptr32 = _ptr32
+    builtins.uint = int
+
+    time.ticks_ms = clock.ticks_ms
+    time.ticks_us = clock.ticks_us
+    time.ticks_add = lambda ticks, delta: ticks + delta
+    time.ticks_diff = lambda end, start: end - start
+    time.sleep_ms = clock.advance_ms
+    time.sleep_us = clock.advance_us
+    gc.mem_alloc = lambda: tracemalloc.get_traced_memory()[0]
+    gc.mem_free = lambda: 200_000
+    if not hasattr(sys, 'print_exception'):
+        import traceback
+        sys.print_exception = lambda e: traceback.print_exception(type(e), e, e.__traceback__)
+
+
+install()
@@ -0,0 +1,79 @@
+import uasyncio
+
+from conftest import run_for
+
+
+def frame(steps, delay_ms=16):
+    while True:
+        steps.append(uasyncio.core.cur_task)
+        yield delay_ms
+
+
+def test_per_task_coroutines_switch_for_every_step(runner):
+    steps = []
+    for _ in range(20):
+        runner.add_task(frame, steps, gc_collect=False)
+    run_for(1000)
+    assert len(steps) == 20 * 63
+    assert uasyncio.core.switches >= len(steps)
+
+
+def test_scheduler_steps_all_due_tasks_in_one_switch(runner):
+    scheduler = runner.use_scheduler()
+    steps = []
+    for _ in range(20):
+        runner.add_task(frame, steps, gc_collect=False)
+    run_for(1000)
+    assert len(steps) == 20 * 63
+    assert scheduler.steps == len(steps)
+    assert scheduler.wakeups <= 63
+    assert len(set(steps)) == 1  # all stepped from the scheduler coroutine
+
+
+def costly(clock, log, delay_ms, cost_us):
+    while True:
+        log.append(clock.ticks_ms())
+        clock.advance_us(cost_us)
+        yield delay_ms
+
+
+def waits_after_first_step(event):
+    yield 1
+    while True:
+        yield event
+
+
+def test_waiting_high_priority_task_does_not_defer(runner, clock):
+    scheduler = runner.use_scheduler(defer_low_priority=True)
+    runner.add_task(waits_after_first_step, uasyncio.Event(), priority=1, gc_collect=False)
+    log = []
+    low = runner.add_task(costly, clock, log, 10, 3000, gc_collect=False)
+    run_for(1000)
+    assert low.deferred == 0
+    assert max([t - 10 * i for i, t in enumerate(log)]) <= 1  # on time
+    assert scheduler.wakeups <= 2 * len(log)  # no spinning on a stale deadline
+
+
+def test_paused_high_priority_task_does_not_defer(runner, clock):
+    scheduler = runner.use_scheduler(defer_low_priority=True)
+    high = runner.add_task(costly, clock, [], 10, 100, priority=1, gc_collect=False)
+    log = []
+    low = runner.add_task(costly, clock, log, 10, 3000, gc_collect=False)
+    run_for(100)
+    high.pause()
+    deferred = low.deferred
+    steps = len(log)
+    run_for(1000)
+    assert low.deferred == deferred
+    assert len(log) - steps >= 100
+
+
+def test_low_priority_work_is_deferred_for_a_close_deadline(runner, clock):
+    runner.use_scheduler(defer_low_priority=True)
+    high_log = []
+    runner.add_task(costly, clock, high_log, 10, 100, priority=1, gc_collect=False)
+    low = runner.add_task(costly, clock, [], 7, 4000, gc_collect=False)
+    run_for(1000)
+    assert low.deferred > 0
+    lateness = [t - 10 * i for i, t in enumerate(high_log)]
+    assert max(lateness) <= 1
@@ -0,0 +1,88 @@
+import pytest
+
+import patterns
+from conftest import run_for
+from pixel_buffers import PixelBufferNeo
+
+
+def cancels_itself(handles, log):
+    try:
+        yield 10
+        handles[0].cancel()
+        yield 10
+        log.append('stepped after cancel')
+    finally:
+        log.append('closed')
+
+
+@pytest.mark.parametrize('scheduler', [False, True])
+def test_task_cancelling_itself_is_closed(runner, scheduler):
+    if scheduler:
+        runner.use_scheduler()
+    handles = []
+    log = []
+    handles.append(runner.add_task(cancels_itself, handles, log, gc_collect=False))
+    run_for(100)
+    assert log == ['closed']
+    assert handles[0].done
+
+
+def driver(pattern, n, log):
+    """
+    Stand-in for a led driver: sets up hardware once and releases it in its finally block
+    """
+    log.append('setup')
+    pixel_buffer = PixelBufferNeo(n, 3)
+    try:
+        for delay_ms in pattern(pixel_buffer=pixel_buffer):
+            log.append(pixel_buffer.buf[0])
+            yield delay_ms
+    finally:
+        log.append('release')
+
+
+def solid(pixel_buffer, word, log=None):
+    try:
+        while True:
+            pixel_buffer.fill_range(0, pixel_buffer.n, word)
+            yield 10
+    finally:
+        if log is not None:
+            log.append('pattern closed')
+
+
+def test_replace_pattern_keeps_the_driver_running(runner):
+    runner.use_scheduler()
+    log = []
+    slot = patterns.PatternSlot(solid, word=0x100, log=log)
+    task = runner.add_task(driver, slot, 4, log, gc_collect=False)
+    run_for(25)
+    task.replace_pattern(solid, word=0x200)
+    run_for(25)
+    task.cancel()
+    assert log[0] == 'setup'
+    assert log.count('setup') == 1
+    assert 'pattern closed' in log
+    assert log[-1] == 'release'
+    assert log.count('release') == 1
+    assert 0x100 in log and log[-2] == 0x200
+    assert slot.replacements == 1
+
+
+def test_replace_pattern_needs_a_pattern_slot(runner):
+    runner.use_scheduler()
+    task = runner.add_task(driver, solid, 4, [], gc_collect=False)
+    run_for(1)
+    with pytest.raises(Exception):
+        task.replace_pattern(solid, word=1)
+
+
+def test_replace_closes_the_whole_generator(runner):
+    runner.use_scheduler()
+    log = []
+    task = runner.add_task(driver, patterns.PatternSlot(solid, word=1), 4, log, gc_collect=False)
+    run_for(25)
+    task.replace(driver, patterns.PatternSlot(solid, word=2), 4, log)
+    run_for(25)
+    assert log.count('setup') == 2
+    assert log.count('release') == 1
@@ -0,0 +1,113 @@
+import importlib
+
+import pytest
+
+import uasyncio
+from conftest import run_for
+
+WAITS = 100
+
+
+def waits_on(event, log):
+    while True:
+        yield event
+        log.append(event)
+
+
+def sets_every_ms(events):
+    while True:
+        for event in events:
+            event.set()
+        yield 1
+
+
+def clears_event(event):
+    while True:
+        yield 0
+        event.clear()
+
+
+@pytest.mark.parametrize('scheduler', [False, True])
+def test_waiting_does_not_create_coroutines(runner, scheduler):
+    if scheduler:
+        runner.use_scheduler()
+    event = uasyncio.Event()
+    flag = uasyncio.ThreadSafeFlag()
+    log = []
+    runner.add_task(waits_on, event, log, gc_collect=False)
+    runner.add_task(waits_on, flag, log, gc_collect=False)
+    runner.add_task(sets_every_ms, [event, flag], gc_collect=False)
+    runner.add_task(clears_event, event, gc_collect=False)
+    uasyncio.coroutine_waits = 0
+    run_for(WAITS)
+    assert log.count(flag) >= WAITS - 1
+    assert log.count(event) >= WAITS - 1
+    assert uasyncio.coroutine_waits == 0
+
+
+def test_falls_back_to_wait_coroutines(runner, monkeypatch):
+    monkeypatch.setattr(runner, '_park', None)
+    event = uasyncio.Event()
+    flag = uasyncio.ThreadSafeFlag()
+    log = []
+    runner.add_task(waits_on, event, log, gc_collect=False)
+    runner.add_task(waits_on, flag, log, gc_collect=False)
+    runner.add_task(sets_every_ms, [event, flag], gc_collect=False)
+    runner.add_task(clears_event, event, gc_collect=False)
+    uasyncio.coroutine_waits = 0
+    run_for(WAITS)
+    assert log.count(flag) >= WAITS - 1
+    assert uasyncio.coroutine_waits >= len(log)
+
+
+def test_cancel_while_waiting_on_a_flag(runner):
+    runner.use_scheduler()
+    log = []
+    task = runner.add_task(waits_on, uasyncio.ThreadSafeFlag(), log, gc_collect=False)
+    run_for(10)
+    task.cancel()
+    run_for(10)
+    assert task.done
+    assert not uasyncio.core._io_queue.map
+
+
+class TaskQueue119:
+    """
+    Task queue of micropython 1.19: push_head instead of push
+    """
+
+    def __init__(self):
+        self.queue = uasyncio.core.TaskQueue()
+
+    def push_head(self, v):
+        self.queue.push(v)
+
+    def peek(self):
+        return self.queue.peek()
+
+    def pop(self):
+        return self.queue.pop()
+
+    def remove(self, v):
+        self.queue.remove(v)
+
+
+@pytest.fixture
+def runner_119(runner, monkeypatch):
+    monkeypatch.setattr(uasyncio.core, 'TaskQueue', TaskQueue119)
+    yield importlib.reload(runner)
+    monkeypatch.undo()
+    importlib.reload(runner)
+
+
+def test_parks_on_the_task_queue_of_micropython_119(runner_119):
+    runner_119.use_scheduler()
+    event = uasyncio.Event()
+    log = []
+    runner_119.add_task(waits_on, event, log, gc_collect=False)
+    runner_119.add_task(sets_every_ms, [event], gc_collect=False)
+    runner_119.add_task(clears_event, event, gc_collect=False)
+    uasyncio.coroutine_waits = 0
+    run_for(WAITS)
+    assert log.count(event) >= WAITS - 1
+    assert uasyncio.coroutine_waits == 0